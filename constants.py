@@ -16,6 +16,10 @@ es_institute_index_mapping = {
         "prompt_output_generated" : {
             "type": "boolean",
         },
+        # Active chunk generation per chunk index, e.g. {"chunk_by_sentence": 1718000000000}
+        "chunk_generations" : {
+            "type": "object",
+        },
         "created_at" : {
             "type": "date",
         },
@@ -5,6 +5,7 @@ from typing import Optional
 class InstituteIds(BaseModel):
     institute_ids: list
     force: Optional[bool] = False
+    bulk: Optional[bool] = False
     index: Optional[str] = "sentence"
     course: Optional[str] = None
     url: Optional[str] = None
@@ -0,0 +1,157 @@
+"""
+Benchmarks embedding profiles offline, reporting recall@k against full-size vectors and vector bytes per chunk.
+
+    python -m embedding.benchmark_embedding_profiles 39261 36347 3310 --index chunk_by_sentence --k 10
+
+The prompts in the prompts index are embedded once at full size and compared with the chunks
+already stored for each institute, which must come from a large-3072 index. Every profile is then
+simulated in memory, with no re-embedding or reindexing:
+
+- truncation: text-embedding-3 vectors requested with `dimensions` are the leading components of
+  the full vector, renormalised, so the stored vectors are cut down the same way
+- int8: each vector component is scalar-quantised between the corpus quantiles, as int8_hnsw does
+
+The exact top k by cosine over full-size vectors is the reference. Scores are exact, so this
+measures what the vector representation loses, not the HNSW search.
+"""
+
+import argparse
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, helpers
+from haystack import Document
+from haystack.components.embedders import OpenAIDocumentEmbedder
+from haystack.utils import Secret
+
+from utils.elastic import get_active_chunk_generation
+from utils.embedding_profiles import EMBEDDING_PROFILES
+
+load_dotenv()
+es_host = os.getenv("ELASTIC_SEARCH_HOST")
+es_user = os.getenv("ELASTICSEARCH_USER")
+es_password = os.getenv("ELASTICSEARCH_PASSWORD")
+open_ai_key = os.environ.get("OPENAI_API_KEY")
+prompts_index = os.environ.get("PROMPTS")
+
+
+def fetch_prompt_queries(es):
+    queries = []
+    for hit in helpers.scan(
+        es,
+        index=prompts_index,
+        query={"query": {"term": {"status": True}}},
+        _source=["prompt", "search_terms"],
+    ):
+        source = hit["_source"]
+        # Same query text query_pipeline_answer_builder embeds
+        queries.append(source.get("search_terms") or source["prompt"])
+    return queries
+
+
+def fetch_chunk_embeddings(es, index, inst_id):
+    generation = get_active_chunk_generation(inst_id, index)
+    if generation is None:
+        active_chunks = {"term": {"status": True}}
+    else:
+        active_chunks = {"term": {"generation": generation}}
+    embeddings = [
+        hit["_source"]["embedding"]
+        for hit in helpers.scan(
+            es,
+            index=index,
+            query={
+                "query": {
+                    "bool": {
+                        "filter": [{"term": {"institute_id": inst_id}}, active_chunks]
+                    }
+                }
+            },
+            _source=["embedding"],
+        )
+        if hit["_source"].get("embedding")
+    ]
+    return np.array(embeddings, dtype=np.float32)
+
+
+def embed_queries(queries):
+    embedder = OpenAIDocumentEmbedder(
+        api_key=Secret.from_token(open_ai_key),
+        model="text-embedding-3-large",
+        progress_bar=False,
+    )
+    documents = embedder.run(documents=[Document(content=query) for query in queries])[
+        "documents"
+    ]
+    return np.array([doc.embedding for doc in documents], dtype=np.float32)
+
+
+def apply_profile(vectors, profile, quantiles=None):
+    if profile["dimensions"]:
+        vectors = vectors[:, : profile["dimensions"]]
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    if profile["quantized"]:
+        low, high = quantiles if quantiles else np.quantile(vectors, [0.005, 0.995])
+        step = (high - low) / 255
+        vectors = np.round((np.clip(vectors, low, high) - low) / step) * step + low
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors, (low, high)
+    return vectors, None
+
+
+def top_k(queries, chunks, k):
+    scores = queries @ chunks.T
+    k = min(k, chunks.shape[0])
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("institute_ids", nargs="+", type=int)
+    parser.add_argument("--index", default="chunk_by_sentence")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(EMBEDDING_PROFILES), choices=EMBEDDING_PROFILES
+    )
+    args = parser.parse_args()
+
+    es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+    queries = fetch_prompt_queries(es)
+    query_vectors = embed_queries(queries)
+    print(f"{len(queries)} prompts, k={args.k}")
+
+    hits = {name: 0 for name in args.profiles}
+    total = 0
+    dims = query_vectors.shape[1]
+    for inst_id in args.institute_ids:
+        chunk_vectors = fetch_chunk_embeddings(es, args.index, inst_id)
+        if not len(chunk_vectors):
+            print(f"No chunks for institute {inst_id}, skipped")
+            continue
+        dims = chunk_vectors.shape[1]
+        k = min(args.k, len(chunk_vectors))
+        reference = top_k(query_vectors, chunk_vectors, k)
+        total += reference.size
+        for name in args.profiles:
+            profile = EMBEDDING_PROFILES[name]
+            profile_chunks, quantiles = apply_profile(chunk_vectors, profile)
+            profile_queries, _ = apply_profile(query_vectors, profile, quantiles)
+            found = top_k(profile_queries, profile_chunks, k)
+            hits[name] += sum(
+                len(set(expected) & set(actual)) for expected, actual in zip(reference, found)
+            )
+
+    for name in args.profiles:
+        profile = EMBEDDING_PROFILES[name]
+        profile_dims = profile["dimensions"] or dims
+        vector_bytes = profile_dims * (1 if profile["quantized"] else 4)
+        recall = hits[name] / total if total else 0
+        print(
+            f"{name:>16}: recall@{args.k} {recall:.3f}, {profile_dims} dims, "
+            f"{vector_bytes} bytes per vector"
+        )
+
+
+if __name__ == "__main__":
+    main()
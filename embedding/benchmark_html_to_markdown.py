@@ -0,0 +1,91 @@
+"""
+Benchmarks HTML-to-markdown conversion, reporting MB per second, peak RSS and output parity.
+
+    python -m embedding.benchmark_html_to_markdown catalogue.html fees.html --repeat 3
+
+Both converters run on the same files, each in a fresh process so their peak
+RSS is measured independently:
+
+- markdownify: URLToDocumentConverterMarkdownify (BeautifulSoup tree + markdownify)
+- streaming: URLToDocumentConverterStreaming (single lxml pass, fed in S3-sized chunks)
+
+Files whose markdown differs between the two are listed at the end.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+
+def run_configuration(name, html_paths, repeat, results):
+    from embedding.custom_converters import URLToDocumentConverterMarkdownify
+    from embedding.html_to_markdown import html_chunks_to_markdown
+    from utils.s3_utils import S3_STREAM_CHUNK_SIZE
+
+    html_contents = []
+    for html_path in html_paths:
+        with open(html_path, "rb") as html_file:
+            html_contents.append(html_file.read())
+
+    outputs = {}
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for html_path, html_content in zip(html_paths, html_contents):
+            if name == "markdownify":
+                outputs[html_path] = URLToDocumentConverterMarkdownify.html_to_markdown(html_content)
+            else:
+                chunks = (
+                    html_content[offset : offset + S3_STREAM_CHUNK_SIZE]
+                    for offset in range(0, len(html_content), S3_STREAM_CHUNK_SIZE)
+                )
+                outputs[html_path] = html_chunks_to_markdown(chunks)
+    elapsed = time.perf_counter() - start_time
+
+    results.put(
+        {
+            "name": name,
+            "megabytes": repeat * sum(len(content) for content in html_contents) / 1024**2,
+            "seconds": elapsed,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "outputs": outputs,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("html_paths", nargs="+")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    outputs = {}
+    for name in ("markdownify", "streaming"):
+        process = context.Process(
+            target=run_configuration,
+            args=(name, args.html_paths, args.repeat, results),
+        )
+        process.start()
+        result = results.get()
+        process.join()
+        outputs[name] = result["outputs"]
+        print(
+            f"{result['name']:>11}: {result['megabytes']:.1f} MB in {result['seconds']:.2f}s "
+            f"({result['megabytes'] / result['seconds']:.2f} MB/s), "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+
+    different = [
+        html_path
+        for html_path in args.html_paths
+        if outputs["markdownify"][html_path] != outputs["streaming"][html_path]
+    ]
+    print(f"identical markdown for {len(args.html_paths) - len(different)}/{len(args.html_paths)} files")
+    for html_path in different:
+        print(f"  differs: {html_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks PDF-to-markdown conversion, reporting pages per second and peak RSS.
+
+    python -m embedding.benchmark_pdf_to_markdown prospectus.pdf fees.pdf --workers 4
+
+Two configurations run on the same files, each in a fresh process so their
+peak RSS is measured independently:
+
+- baseline: serial, every page fully analysed, gc.collect() after each page
+  (how the converters used to run)
+- current: convert_pdf_to_markdown with page triage, page workers and no forced collections
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+import resource
+import time
+
+
+def run_configuration(name, pdf_paths, ocr_type, workers, results):
+    # Configure before the converter module reads its settings at import time
+    os.environ["PDF_PAGE_WORKERS"] = str(1 if name == "baseline" else workers)
+    from embedding import pdf_to_markdown
+
+    pdf_contents = []
+    num_pages = 0
+    for pdf_path in pdf_paths:
+        with open(pdf_path, "rb") as pdf_file:
+            pdf_contents.append(pdf_file.read())
+        with pdf_to_markdown.open_pdf(pdf_contents[-1]) as pdf:
+            num_pages += len(pdf.pages)
+
+    start_time = time.perf_counter()
+    for pdf_path, file_content in zip(pdf_paths, pdf_contents):
+        if name == "baseline":
+            page_to_markdown = pdf_to_markdown.PAGE_CONVERTERS[ocr_type]
+            with pdf_to_markdown.open_pdf(file_content) as pdf:
+                for page_num, page in enumerate(pdf.pages, start=1):
+                    page_to_markdown(page, page_num, pdf_path)
+                    page.close()
+                    gc.collect()
+        else:
+            pdf_to_markdown.convert_pdf_to_markdown(file_content, pdf_path, ocr_type)
+    elapsed = time.perf_counter() - start_time
+
+    pdf_to_markdown.recycle_page_pool(wait=True)
+    results.put(
+        {
+            "name": name,
+            "pages": num_pages,
+            "seconds": elapsed,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            / 1024,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdf_paths", nargs="+")
+    parser.add_argument(
+        "--ocr-type", default="PYTESSERACT", choices=["PYTESSERACT", "PADDLE"]
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    for name in ("baseline", "current"):
+        process = context.Process(
+            target=run_configuration,
+            args=(name, args.pdf_paths, args.ocr_type, args.workers, results),
+        )
+        process.start()
+        result = results.get()
+        process.join()
+        print(
+            f"{result['name']:>8}: {result['pages']} pages in {result['seconds']:.2f}s "
+            f"({result['pages'] / result['seconds']:.2f} pages/s), "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB, "
+            f"peak worker RSS {result['peak_worker_rss_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
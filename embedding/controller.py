@@ -1,12 +1,18 @@
 import logging
+import os
+import sys
+from contextlib import ExitStack
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Optional
 from .utils import (
     get_chunk_index,
     check_id_already_exists,
     generate_embedding,
-    update_institute_embedding_status,
+    suspended_refresh,
 )
+from .pdf_to_markdown import init_pdf_converter_process
+
+embedding_worker_max_tasks = int(os.environ.get("EMBEDDING_WORKER_MAX_TASKS", 5))
 
 
 def process_single_institute(
@@ -18,9 +24,6 @@ def process_single_institute(
             if already_exist:
                 return inst_id, "Already Exist"
 
-        if force:
-            update_institute_embedding_status(inst_id, chunk_index)
-
         result = generate_embedding(inst_id, chunk_index, index_type)
         return inst_id, result
     except Exception as e:
@@ -33,39 +36,55 @@ def extract_and_save_college_data(item, default=None, max_workers: int = 5):
         institute_ids = default["institute_ids"]
         index_type = default["index"]
         force = default["force"]
+        bulk = default.get("bulk", False)
     else:
         institute_ids = item.institute_ids
         index_type = item.index
         force = item.force
+        bulk = item.bulk
 
     chunk_index = get_chunk_index(index_type)
     response = {}
 
-    try:
-        # Use ProcessPoolExecutor for parallel processing
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            # Create future tasks for all institutes
-            future_to_inst = {
-                executor.submit(
-                    process_single_institute, inst_id, chunk_index, index_type, force
-                ): inst_id
-                for inst_id in institute_ids
-            }
+    pool_options = {}
+    if sys.version_info >= (3, 11):
+        # Recycle workers so memory retained by converters is returned to the OS between institutes
+        pool_options["max_tasks_per_child"] = embedding_worker_max_tasks
 
-            # Process completed tasks as they finish
-            for future in as_completed(future_to_inst):
-                inst_id, result = future.result()
-                response[inst_id] = result
-                logging.info(f"Completed processing institute {inst_id}: {result}")
+    with ExitStack() as stack:
+        if bulk:
+            # No periodic refreshes during the batch; each institute refreshes once before switching generation
+            stack.enter_context(suspended_refresh(chunk_index))
+        try:
+            # Use ProcessPoolExecutor for parallel processing
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=init_pdf_converter_process,
+                initargs=(max_workers,),
+                **pool_options,
+            ) as executor:
+                # Create future tasks for all institutes
+                future_to_inst = {
+                    executor.submit(
+                        process_single_institute, inst_id, chunk_index, index_type, force
+                    ): inst_id
+                    for inst_id in institute_ids
+                }
 
-    except Exception as e:
-        logging.error(f"Error in parallel processing: {str(e)}")
-        # Fallback to sequential processing in case of parallel processing failure
-        logging.info("Falling back to sequential processing")
-        for inst_id in institute_ids:
-            inst_id, result = process_single_institute(
-                inst_id, chunk_index, index_type, force
-            )
-            response[inst_id] = result
+                # Process completed tasks as they finish
+                for future in as_completed(future_to_inst):
+                    inst_id, result = future.result()
+                    response[inst_id] = result
+                    logging.info(f"Completed processing institute {inst_id}: {result}")
+
+        except Exception as e:
+            logging.error(f"Error in parallel processing: {str(e)}")
+            # Fallback to sequential processing in case of parallel processing failure
+            logging.info("Falling back to sequential processing")
+            for inst_id in institute_ids:
+                inst_id, result = process_single_institute(
+                    inst_id, chunk_index, index_type, force
+                )
+                response[inst_id] = result
 
     return response
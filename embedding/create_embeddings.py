@@ -3,24 +3,24 @@ import os
 from haystack.utils import Secret
 import asyncio
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from haystack.document_stores.types import DuplicatePolicy
 from .custom_converters import (
     URLToDocumentConverterMarkdownify,
+    URLToDocumentConverterStreaming,
     DocxToTextConverter,
     PDFToDocumentConverter,
 )
 
 from haystack import Pipeline
 from haystack.components.preprocessors import DocumentCleaner
-from haystack.components.writers import DocumentWriter
 from haystack.components.embedders import (
     AzureOpenAIDocumentEmbedder,
     OpenAIDocumentEmbedder,
 )
-from haystack_integrations.document_stores.elasticsearch import (
-    ElasticsearchDocumentStore,
-)
+from elasticsearch import Elasticsearch
 from .custom_doc_splitter import CustomDocumentSplitter
+from .custom_embedder import ChunkReuseEmbedder
+from .custom_writer import BulkDocumentWriter, ChunkBulkBuffer
+from utils.embedding_profiles import create_chunk_index, get_embedder_params
 import logging
 
 load_dotenv()  # Load the .env file
@@ -34,6 +34,8 @@ log_files_folder = os.environ.get("LOG_FILES_FOLDER")
 azure_endpoint = os.environ.get("AZURE_ENDPOINT")
 azure_openai_api_key = os.environ.get("AZURE_OPENAI_API_KEY")
 azure_embedding_deployment_model = os.environ.get("AZURE_EMBEDDING_DEPLOYMENT_MODEL")
+# "STREAMING" converts HTML with a single lxml pass; anything else keeps markdownify
+html_converter = os.environ.get("HTML_CONVERTER", "MARKDOWNIFY").upper()
 try:
     log_file_path = os.path.join(log_files_folder, "indexing.log")
     logging.basicConfig(
@@ -46,14 +48,15 @@ except Exception as e:
     print(f"Failed to set up logging: {e}")
 
 
-def write_documents(url_details, inst_id, document_store, index_type):
+def write_documents(url_details, inst_id, chunk_buffer, index_type, index):
     """
     Processes a given document by converting, cleaning, splitting, embedding, and writing it to a document store.
 
     Parameters:
     - file_path (Path): The path to the document file.
     - inst_id (str): An identifier for the institution to which the document belongs.
-    - document_store (ElasticsearchDocumentStore): The document store where the processed documents will be stored.
+    - chunk_buffer (ChunkBulkBuffer): The buffer that writes the processed chunks to the chunk index in bulk.
+    - index (str): The chunk index behind the document store, where existing embeddings are looked up by content hash.
 
     Raises:
     - Exception: Propagates exceptions that might occur during document processing.
@@ -74,7 +77,10 @@ def write_documents(url_details, inst_id, document_store, index_type):
         filetype = "pdf"
     elif file_path.lower().endswith(".html"):
         # pipeline.add_component("converter", HTMLToDocument())
-        pipeline.add_component("converter", URLToDocumentConverterMarkdownify())
+        if html_converter == "STREAMING":
+            pipeline.add_component("converter", URLToDocumentConverterStreaming())
+        else:
+            pipeline.add_component("converter", URLToDocumentConverterMarkdownify())
 
         filetype = "html"
     elif file_path.lower().endswith(".docx"):
@@ -118,15 +124,18 @@ def write_documents(url_details, inst_id, document_store, index_type):
     #    )
     pipeline.add_component(
         "embedder",
-        OpenAIDocumentEmbedder(
-            api_key=Secret.from_token(open_ai_key),
-            model="text-embedding-3-large",
-            progress_bar=False,
+        ChunkReuseEmbedder(
+            embedder=OpenAIDocumentEmbedder(
+                api_key=Secret.from_token(open_ai_key),
+                progress_bar=False,
+                **get_embedder_params(index),
+            ),
+            index=index,
         ),
     )
     pipeline.add_component(
         "writer",
-        DocumentWriter(document_store=document_store, policy=DuplicatePolicy.OVERWRITE),
+        BulkDocumentWriter(buffer=chunk_buffer),
     )
 
     pipeline.connect("converter", "cleaner")
@@ -145,7 +154,6 @@ def write_documents(url_details, inst_id, document_store, index_type):
                         "filetype": filetype,
                         "file_url": file_url,
                         "s3_url": s3_url,
-                        "status": True,
                     },
                 }
             }
@@ -156,24 +164,24 @@ def write_documents(url_details, inst_id, document_store, index_type):
         logging.error(f"Failed to process document {file_path}: {e}")
 
 
-async def process_documents_async(url_details, inst_id, executor, index, index_type):
+async def process_documents_async(
+    url_details, inst_id, executor, index, index_type, chunk_buffer
+):
     """
-    Asynchronously processes documents by creating a document store and running the document writing operations in a thread pool.
+    Asynchronously processes documents by running the document writing operations in a thread pool.
 
     Parameters:
     - file_path (Path): The path to the document file.
     - inst_id (str): An identifier for the institution to which the document belongs.
     - executor (ThreadPoolExecutor): The executor to run asynchronous tasks.
     - index (str): The index name in the Elasticsearch document store.
+    - chunk_buffer (ChunkBulkBuffer): The buffer shared by all documents of the institute.
 
     Returns:
     None
     """
     # print(f"Writing document {file_path.name}")
     loop = asyncio.get_running_loop()
-    document_store = ElasticsearchDocumentStore(
-        hosts=es_host, index=index, basic_auth=(es_user, es_password)
-    )
 
     # Run the synchronous function using a thread pool
     await loop.run_in_executor(
@@ -181,37 +189,61 @@ async def process_documents_async(url_details, inst_id, executor, index, index_t
         write_documents,
         url_details,
         inst_id,
-        document_store,
+        chunk_buffer,
         index_type,
+        index,
     )
 
 
-async def process_all_documents(scrape_data, inst_id, index_type, index):
+async def process_all_documents(scrape_data, inst_id, index_type, index, generation):
     """
     Processes all documents in the given directories asynchronously.
 
     Parameters:
-    - directories (list): A list of directories containing the documents to process.
+    - scrape_data (iterable): The scraped assets to process, each with `actual_url` and `s3_url`; read lazily.
     - inst_id (str): An identifier for the institution to which the documents belong.
     - index (str): The index name in the Elasticsearch document store.
+    - generation (int): The chunk generation to write; it is activated by the caller once everything is written.
 
     Returns:
-    None
+    int: The number of chunks written.
     """
 
     # nest_asyncio.apply()
     executor = ThreadPoolExecutor(max_workers=1)
+    es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+    create_chunk_index(es, index)
+    chunk_buffer = ChunkBulkBuffer(client=es, index=index, generation=generation)
     tasks = []
     print(f"Writing documents for instid {inst_id}")
 
-    for url_details in scrape_data:
-        task = process_documents_async(
-            url_details,
-            inst_id,
-            executor,
-            index,
-            index_type,
-        )
-        tasks.append(task)
-    await asyncio.gather(*tasks)
-    executor.shutdown()
+    loop = asyncio.get_running_loop()
+    scrape_data = iter(scrape_data)
+    try:
+        while True:
+            # Pull the next asset off the event loop, so scheduled documents keep running while a page loads
+            url_details = await loop.run_in_executor(None, next, scrape_data, None)
+            if url_details is None:
+                break
+            task = asyncio.ensure_future(
+                process_documents_async(
+                    url_details,
+                    inst_id,
+                    executor,
+                    index,
+                    index_type,
+                    chunk_buffer,
+                )
+            )
+            tasks.append(task)
+    finally:
+        await asyncio.gather(*tasks)
+        executor.shutdown()
+    try:
+        chunk_buffer.flush()
+    finally:
+        es.close()
+    logging.info(
+        f"Wrote {chunk_buffer.written} chunks for instid {inst_id} to {index}, {chunk_buffer.failed} failed"
+    )
+    return chunk_buffer.written
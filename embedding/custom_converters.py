@@ -4,49 +4,55 @@ from typing import List, Union, Dict, Any, Optional
 from haystack import Document
 import docx
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Union
 from haystack import Document, component
 from .pdf_to_markdown import convert_pdf_to_markdown_using_paddleocr, convert_pdf_to_markdown_using_pytesseract
+from .html_to_markdown import StreamingMarkdownWriter
 from markdownify import MarkdownConverter
 import re
 import io
 import os
-import boto3
-from botocore.client import Config
-import gc
+from utils.s3_utils import get_s3_key
+from utils.s3_cache import s3_document_cache
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-aws_access_key = os.environ.get("AWS_ACCESS_KEY")
-aws_secret_key = os.environ.get("AWS_SECRET_KEY")
-aws_region = os.environ.get("AWS_REGION")
 ocr_type = os.environ.get("OCR_TYPE")
 
 
 def get_s3_file_content(file_path: str) -> Optional[bytes]:
-    bucket_name = "cld-data-extraction"
-    key = file_path[len("https://cld-data-extraction.s3.amazonaws.com/") :]
+    try:
+        return s3_document_cache.read(get_s3_key(file_path))
+    except Exception as e:
+        print(f"S3 URL: {file_path} Got S3 Error: ", e)
+        return None
 
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=aws_access_key,
-        aws_secret_access_key=aws_secret_key,
-        config=Config(signature_version="s3v4"),
-        region_name=aws_region,
-    )
 
+def iter_s3_file_content(file_path: str) -> Iterator[bytes]:
+    """
+    Yields the object in chunks as it is downloaded, for converters that can parse incrementally.
+    S3 errors are raised, also after some chunks were yielded, so callers never mistake a truncated
+    object for a complete one.
+    """
     try:
-        with io.BytesIO() as file_object:
-            s3_client.download_fileobj(bucket_name, key, file_object)
-            file_object.seek(0)
-            return file_object.read()
+        yield from s3_document_cache.stream(get_s3_key(file_path))
+    except Exception as e:
+        print(f"S3 URL: {file_path} Got S3 Error: ", e)
+        raise
+
+
+def get_s3_file_path(file_path: str) -> Optional[str]:
+    """
+    Returns the path of the file in the local cache, so PDF readers and page workers open it from disk without
+    loading it into memory; None on S3 errors.
+    """
+    try:
+        return s3_document_cache.get_path(get_s3_key(file_path))
     except Exception as e:
         print(f"S3 URL: {file_path} Got S3 Error: ", e)
         return None
-    finally:
-        s3_client.close()
 
 
 @component
@@ -62,21 +68,18 @@ class PDFToDocumentConverter:
         documents = []
         for file_path in sources:
             meta["file_path"] = file_path
-            file_content = get_s3_file_content(file_path)
-            if file_content:
-                try:
-                    if ocr_type=="PADDLE":
-                        extracted_text = convert_pdf_to_markdown_using_paddleocr(file_content, file_path)
-                    else:
-                        extracted_text = convert_pdf_to_markdown_using_pytesseract(file_content, file_path)
-                    doc = Document(content=extracted_text, meta=meta.copy())
-                    documents.append(doc)
-                except Exception as e:
-                    print(f"S3 URL: {file_path} Got PDF Converter Error: ", e)
-                finally:
-                    del file_content
-                    del extracted_text
-                    gc.collect()  # Force garbage collection
+            pdf_path = get_s3_file_path(file_path)
+            if not pdf_path:
+                continue
+            try:
+                if ocr_type=="PADDLE":
+                    extracted_text = convert_pdf_to_markdown_using_paddleocr(pdf_path, file_path)
+                else:
+                    extracted_text = convert_pdf_to_markdown_using_pytesseract(pdf_path, file_path)
+                doc = Document(content=extracted_text, meta=meta.copy())
+                documents.append(doc)
+            except Exception as e:
+                print(f"S3 URL: {file_path} Got PDF Converter Error: ", e)
         return {"documents": documents}
 
 
@@ -100,34 +103,70 @@ class URLToDocumentConverterMarkdownify:
             html_content = get_s3_file_content(file_path)
             if html_content:
                 try:
-                    html = html_content.decode("utf-8")
-                    soup = BeautifulSoup(html, "lxml")
-
-                    for table in soup.find_all("table"):
-                        table.insert_before(soup.new_string("[TABLE]"))
-                        table.insert_after(soup.new_string("[/TABLE]"))
-
-                    md_content = self.md_soup(
-                        soup,
-                        strip=["a", "nav", "footer", "img"],
-                        heading_style="ATX",
-                        autolinks=False,
-                        wrap=False,
-                        newline_style="\n",
-                        escape_asterisks=True,
-                        escape_underscores=True,
-                    )
-                    md_content = re.sub(r"\n{2,}", "\n", md_content)
+                    md_content = self.html_to_markdown(html_content)
                     doc = Document(content=md_content, meta=meta.copy())
                     documents.append(doc)
                 except Exception as e:
                     print(f"S3 URL: {file_path} Got HTML Converter Error: ", e)
-                finally:
-                    del html_content
-                    del html
-                    del soup
-                    del md_content
-                    gc.collect()  # Force garbage collection
+        return {"documents": documents}
+
+    @classmethod
+    def html_to_markdown(cls, html_content: bytes) -> str:
+        soup = BeautifulSoup(html_content.decode("utf-8"), "lxml")
+        try:
+            for table in soup.find_all("table"):
+                table.insert_before(soup.new_string("[TABLE]"))
+                table.insert_after(soup.new_string("[/TABLE]"))
+
+            md_content = cls.md_soup(
+                soup,
+                strip=["a", "nav", "footer", "img"],
+                heading_style="ATX",
+                autolinks=False,
+                wrap=False,
+                newline_style="\n",
+                escape_asterisks=True,
+                escape_underscores=True,
+            )
+            return re.sub(r"\n{2,}", "\n", md_content)
+        finally:
+            # The tree is full of parent/child cycles; break them so it is freed by refcounting
+            soup.decompose()
+
+
+@component
+class URLToDocumentConverterStreaming:
+    """
+    Drop-in replacement for URLToDocumentConverterMarkdownify that converts the HTML
+    with a single lxml pass while it is streamed from S3, without building a soup.
+    """
+
+    @component.output_types(documents=List[Document])
+    def run(
+        self,
+        sources: List[Union[str, Path]],
+        meta: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+    ):
+        if meta is None:
+            meta = {}
+        documents = []
+        for file_path in sources:
+            meta["file_path"] = file_path
+            try:
+                writer = StreamingMarkdownWriter()
+                received = False
+                for chunk in iter_s3_file_content(file_path):
+                    writer.feed(chunk)
+                    received = True
+                if not received:
+                    continue
+                md_content = re.sub(r"\n{2,}", "\n", writer.close())
+            except Exception as e:
+                # Also raised when the download fails midway; the partly converted page is dropped
+                # rather than indexed truncated
+                print(f"S3 URL: {file_path} Got HTML Converter Error, skipping document: ", e)
+                continue
+            documents.append(Document(content=md_content, meta=meta.copy()))
         return {"documents": documents}
 
 
@@ -291,25 +330,15 @@ class DocxToTextConverter:
             meta = {}
         documents = []
         for file_path in sources:
-            source = file_path
-            bucket_name = "cld-data-extraction"
-            key = source[len("https://cld-data-extraction.s3.amazonaws.com/") :]
-
-            s3_client = boto3.client(
-                "s3",
-                aws_access_key_id=aws_access_key,
-                aws_secret_access_key=aws_secret_key,
-                config=Config(signature_version="s3v4"),
-                region_name=aws_region,
-            )
+            file_content = get_s3_file_content(file_path)
+            if not file_content:
+                continue
 
             try:
-                s3_object = s3_client.get_object(Bucket=bucket_name, Key=key)
-                file_content = s3_object["Body"].read()
                 doc = docx.Document(io.BytesIO(file_content))
-
             except Exception as e:
                 print("Got error:- ", e)
+                continue
 
             text = ""
             for para in doc.paragraphs:
@@ -194,13 +194,25 @@ class CustomDocumentSplitter:
 
         return final_units
 
+    @staticmethod
+    def _count_unit_tokens(elements: List[str]) -> List[int]:
+        """
+        Counts the tokens of every unit once, in one batched call. Units are encoded on their own rather than
+        as one text, as cl100k_base attaches the space before a word to the word's token, so tokens of the
+        joined text cross unit boundaries.
+        """
+        return [len(tokens) for tokens in ENCODING.encode_batch(elements, disallowed_special=())]
+
     def _concatenate_units(
         self, elements: List[str], split_length: int, split_overlap: int
     ) -> Tuple[List[str], List[int]]:
         text_splits = []
         splits_pages = []
         cur_page = 1
-        segments = windowed(elements, n=split_length, step=split_length - split_overlap)
+        unit_token_counts = self._count_unit_tokens(elements)
+        segments = windowed(
+            range(len(elements)), n=split_length, step=split_length - split_overlap
+        )
 
         current_split = ""
         current_split_page = cur_page
@@ -210,7 +222,7 @@ class CustomDocumentSplitter:
             current_units = [unit for unit in seg if unit is not None]
 
             for unit in current_units:
-                unit_tokens = len(ENCODING.encode(unit))
+                unit_tokens = unit_token_counts[unit]
 
                 if current_token_count + unit_tokens > MAX_TOKENS:
                     if current_split:
@@ -219,20 +231,21 @@ class CustomDocumentSplitter:
                     current_split = ""
                     current_token_count = 0
 
-                current_split += unit
+                current_split += elements[unit]
                 current_token_count += unit_tokens
 
+                # Only a single oversized unit can get here
                 while current_token_count > MAX_TOKENS:
-                    encoded_split = ENCODING.encode(current_split)
+                    encoded_split = ENCODING.encode(current_split, disallowed_special=())
                     text_splits.append(ENCODING.decode(encoded_split[:MAX_TOKENS]))
                     splits_pages.append(current_split_page)
                     current_split = ENCODING.decode(encoded_split[MAX_TOKENS:])
-                    current_token_count = len(ENCODING.encode(current_split))
+                    current_token_count = len(ENCODING.encode(current_split, disallowed_special=()))
 
             if self.split_by == "page":
                 num_page_breaks = len(current_units)
             else:
-                num_page_breaks = sum(unit.count("\f") for unit in current_units)
+                num_page_breaks = sum(elements[unit].count("\f") for unit in current_units)
             cur_page += num_page_breaks
 
         if current_split:
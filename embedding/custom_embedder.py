@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import os
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+from haystack import Document, component
+
+load_dotenv()
+es_host = os.getenv("ELASTIC_SEARCH_HOST")
+es_user = os.getenv("ELASTICSEARCH_USER")
+es_password = os.getenv("ELASTICSEARCH_PASSWORD")
+
+es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+
+# Hashes per lookup request, well below the default terms query limit
+HASH_LOOKUP_BATCH_SIZE = 500
+
+
+def get_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@component
+class ChunkReuseEmbedder:
+    """
+    Embeds documents with the wrapped embedder, reusing vectors already stored in the chunk index.
+
+    Every chunk is tagged with a `content_hash` meta field. Before calling the embedding API, a chunk whose hash
+    matches any stored chunk, of any generation, gets a copy of that vector. Only the remaining chunks are sent
+    to the wrapped embedder.
+    """
+
+    def __init__(self, embedder, index: str):
+        """
+        :param embedder: The document embedder used for chunks with unseen text.
+        :param index: The chunk index the documents will be written to; vectors are only reused from it,
+            so they always come from the same embedding model.
+        """
+        self.embedder = embedder
+        self.index = index
+
+    def _stored_embeddings(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        embeddings = {}
+        for start in range(0, len(content_hashes), HASH_LOOKUP_BATCH_SIZE):
+            batch = content_hashes[start : start + HASH_LOOKUP_BATCH_SIZE]
+            response = es.search(
+                index=self.index,
+                query={"terms": {"content_hash": batch}},
+                collapse={"field": "content_hash"},
+                source=["content_hash", "embedding"],
+                size=len(batch),
+            )
+            for hit in response["hits"]["hits"]:
+                source = hit["_source"]
+                if source.get("embedding"):
+                    embeddings[source["content_hash"]] = source["embedding"]
+        return embeddings
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        """
+        Embeds a list of documents.
+
+        :param documents: Documents to embed.
+
+        :returns: A dictionary with the following keys:
+            - `documents`: Documents to write, each with its embedding.
+            - `meta`: Information about the usage of the wrapped embedder, empty when nothing was sent to it.
+        """
+        if not documents:
+            return {"documents": [], "meta": {}}
+
+        for doc in documents:
+            doc.meta["content_hash"] = get_content_hash(doc.content or "")
+
+        try:
+            stored = self._stored_embeddings(
+                list({doc.meta["content_hash"] for doc in documents})
+            )
+        except Exception as e:
+            logging.error(f"Chunk hash lookup failed on {self.index}, embedding everything: {e}")
+            stored = {}
+
+        reused = []
+        to_embed = []
+        for doc in documents:
+            embedding = stored.get(doc.meta["content_hash"])
+            if embedding is not None:
+                doc.embedding = embedding
+                reused.append(doc)
+            else:
+                to_embed.append(doc)
+
+        meta = {}
+        if to_embed:
+            result = self.embedder.run(documents=to_embed)
+            to_embed = result["documents"]
+            meta = result["meta"]
+
+        logging.info(
+            f"Chunks on {self.index}: {len(reused)} vectors copied, {len(to_embed)} embedded"
+        )
+        return {"documents": reused + to_embed, "meta": meta}
@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+from typing import List
+
+from elasticsearch import Elasticsearch, helpers
+from haystack import Document, component
+
+# Chunks per bulk request; one document rarely fills a batch on its own
+CHUNK_BULK_BATCH_SIZE = int(os.environ.get("CHUNK_BULK_BATCH_SIZE", 1000))
+
+
+class ChunkBulkBuffer:
+    """
+    Collects chunks from every document of an ingestion run and writes them to the chunk index in bulk batches.
+
+    Chunks are tagged with the generation when written rather than in their meta, so their document IDs, which
+    haystack hashes from content and meta, stay the same across re-embeds. They are stored under the document ID
+    suffixed with the generation, so a new generation never overwrites the chunks of the one still serving
+    retrieval.
+
+    Documents are written with the `index` op type, which overwrites chunks stored under the same ID like
+    `DuplicatePolicy.OVERWRITE` does. Unlike `ElasticsearchDocumentStore.write_documents`, the requests don't
+    wait for a refresh, so writes keep going while refresh is suspended on the index.
+    """
+
+    def __init__(
+        self, client: Elasticsearch, index: str, generation: int, batch_size: int = CHUNK_BULK_BATCH_SIZE
+    ):
+        """
+        :param client: The Elasticsearch client to write with. The index must already exist with the
+            embedding mapping, see `create_chunk_index`.
+        :param index: The chunk index to write to.
+        :param generation: The chunk generation the chunks are written under.
+        :param batch_size: Number of chunks sent per bulk request.
+        """
+        self.client = client
+        self.index = index
+        self.generation = generation
+        self.batch_size = batch_size
+        self._pending: List[Document] = []
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def add(self, documents: List[Document]):
+        with self._lock:
+            self._pending.extend(documents)
+            while len(self._pending) >= self.batch_size:
+                batch = self._pending[: self.batch_size]
+                self._pending = self._pending[self.batch_size :]
+                self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                batch = self._pending
+                self._pending = []
+                self._write(batch)
+
+    def _write(self, documents: List[Document]):
+        written, errors = helpers.bulk(
+            self.client,
+            (
+                {
+                    "_op_type": "index",
+                    "_index": self.index,
+                    "_id": f"{doc.id}-{self.generation}",
+                    "_source": {**doc.to_dict(), "generation": self.generation},
+                }
+                for doc in documents
+            ),
+            raise_on_error=False,
+        )
+        self.written += written
+        if errors:
+            self.failed += len(errors)
+            logging.error(
+                f"Failed to write {len(errors)} of {len(documents)} chunks to {self.index}: {errors[0]}"
+            )
+
+
+@component
+class BulkDocumentWriter:
+    """
+    Hands the documents of one pipeline run to a `ChunkBulkBuffer` shared by all documents of the ingestion run.
+
+    A component can only be added to one pipeline, so every pipeline gets its own writer around the shared buffer.
+    Documents are written when the buffer fills up or is flushed, not when the pipeline returns.
+    """
+
+    def __init__(self, buffer: ChunkBulkBuffer):
+        """
+        :param buffer: The buffer collecting chunks for the chunk index.
+        """
+        self.buffer = buffer
+
+    @component.output_types(documents_written=int)
+    def run(self, documents: List[Document]):
+        """
+        Queues documents for writing.
+
+        :param documents: Documents to write.
+
+        :returns: A dictionary with the following keys:
+            - `documents_written`: Number of documents queued.
+        """
+        self.buffer.add(documents)
+        return {"documents_written": len(documents)}
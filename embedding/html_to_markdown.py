@@ -0,0 +1,326 @@
+import re
+from typing import Iterable, List, Optional
+
+from lxml import etree
+
+# The rules below mirror markdownify's MarkdownConverter with the options used by
+# URLToDocumentConverterMarkdownify, so both converters produce the same chunks.
+SPACES_RE = re.compile(r"[\t ]+")
+LINE_BEGINNING_RE = re.compile(r"^", re.MULTILINE)
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+INLINE_MARKUP = {
+    "b": "**",
+    "strong": "**",
+    "i": "*",
+    "em": "*",
+    "del": "~~",
+    "s": "~~",
+    "code": "`",
+    "kbd": "`",
+    "samp": "`",
+    "sub": "",
+    "sup": "",
+}
+CODE_TAGS = {"pre", "code", "kbd", "samp"}
+SKIPPED_TAGS = {"script", "style"}
+NESTED_TAGS = {"ol", "ul", "li", "table", "thead", "tbody", "tfoot", "tr", "td", "th"}
+BUFFERED_TAGS = {"li", "td", "th", "tr", "blockquote", "pre"} | set(HEADING_TAGS) | set(INLINE_MARKUP)
+LIST_BULLETS = "*+-"
+
+# The [TABLE]/[/TABLE] markers are text nodes around each table, so a table's
+# neighbours see text rather than a nested node
+TABLE_MARKER = "#text"
+# Comments write nothing but are still siblings for the whitespace rules
+COMMENT = "#comment"
+
+
+def int_attribute(element, name: str, default: int) -> int:
+    try:
+        return int(element.get(name) or default)
+    except ValueError:
+        return default
+
+
+class _Frame:
+    __slots__ = (
+        "tag", "text_done", "skip", "pre", "code", "as_inline", "inline_children",
+        "buffer", "mark", "nested", "first", "index", "children", "cells", "has_thead",
+    )
+
+    def __init__(self, tag: str, parent: Optional["_Frame"]):
+        self.tag = tag
+        self.text_done = False
+        self.skip = tag in SKIPPED_TAGS or (parent is not None and parent.skip)
+        self.pre = tag == "pre" or (parent is not None and parent.pre)
+        self.code = tag in CODE_TAGS or (parent is not None and parent.code)
+        self.as_inline = parent is not None and parent.inline_children
+        self.inline_children = self.as_inline or tag in HEADING_TAGS or tag in ("td", "th")
+        self.buffer: Optional[List[str]] = None
+        self.mark = 0
+        self.nested = False
+        # Position among the parent's children, which decides ol numbering and table header rows
+        self.index = parent.children if parent is not None else 0
+        self.first = self.index == 0
+        self.children = 0
+        self.cells: List[int] = []
+        self.has_thead = False
+
+
+class StreamingMarkdownWriter:
+    """
+    Converts HTML to the same markdown as URLToDocumentConverterMarkdownify (ATX
+    headings, [TABLE] wrapped pipe tables, a/nav/footer/img stripped) in a single
+    pass over lxml parser events instead of a BeautifulSoup tree.
+
+    Text is written out as soon as the parser has seen it and finished elements
+    are removed from the tree, so memory is bounded by the open element path and
+    the largest heading, list item or table row rather than by the page.
+    """
+
+    def __init__(self):
+        self.parser = etree.HTMLPullParser(
+            events=("start", "end", "comment"),
+            encoding="utf-8",
+            remove_pis=True,
+        )
+        self.stack: List[_Frame] = []
+        self.output: List[str] = []
+        self.pending = None
+
+    def _sink(self) -> List[str]:
+        for frame in reversed(self.stack):
+            if frame.buffer is not None:
+                return frame.buffer
+        return self.output
+
+    def _write(self, text: str):
+        if text:
+            self._sink().append(text)
+
+    @staticmethod
+    def _is_extracted(text: str, frame: Optional[_Frame], prev_tag, next_tag) -> bool:
+        # markdownify drops whitespace-only text at the edges of, or between, nested nodes
+        return (
+            frame is not None
+            and frame.tag in NESTED_TAGS
+            and not text.strip()
+            and (prev_tag is None or next_tag is None or prev_tag in NESTED_TAGS or next_tag in NESTED_TAGS)
+        )
+
+    def _text(self, text: Optional[str], frame: Optional[_Frame], prev_tag, next_tag):
+        """
+        Writes a text node; `prev_tag`/`next_tag` name its siblings, None when there is none.
+        """
+        if not text or self._is_extracted(text, frame, prev_tag, next_tag):
+            return
+        if frame is None:
+            self._write(text)
+            return
+        frame.children += 1
+        if frame.skip:
+            return
+        if not frame.pre:
+            text = SPACES_RE.sub(" ", text)
+        if not frame.code:
+            text = text.replace("*", r"\*").replace("_", r"\_")
+        if frame.tag == "li" and next_tag in (None, "ul", "ol"):
+            text = text.rstrip()
+        self._write(text)
+
+    def _marker(self, marker: str):
+        frame = self.stack[-1] if self.stack else None
+        if frame is not None:
+            frame.children += 1
+            if frame.skip:
+                return
+        self._write(marker)
+
+    def _flush_pending(self, next_tag: Optional[str]):
+        """
+        Writes the tail of the element that just ended, now that its next sibling is known.
+        """
+        if self.pending is None:
+            return
+        element, closed = self.pending
+        self.pending = None
+        parent = self.stack[-1] if self.stack else None
+        prev_tag = TABLE_MARKER if closed.tag == "table" else closed.tag
+        tail = element.tail
+        if tail and self._is_extracted(tail, parent, prev_tag, next_tag):
+            tail = None
+
+        if closed.tag in ("ul", "ol") and not closed.nested and not closed.skip:
+            following = "#text" if tail else next_tag
+            if following is not None and following not in ("ul", "ol"):
+                self._write("\n")
+        self._text(tail, parent, prev_tag, next_tag)
+
+        # Everything up to and including this element has been written out
+        element.clear()
+        element_parent = element.getparent()
+        if element_parent is not None:
+            element_parent.remove(element)
+
+    def _start(self, element):
+        tag = element.tag.lower() if isinstance(element.tag, str) else COMMENT
+        sibling_tag = TABLE_MARKER if tag == "table" else tag
+        self._flush_pending(sibling_tag)
+        parent = self.stack[-1] if self.stack else None
+        if parent is not None and not parent.text_done and element.getparent() is not None:
+            self._text(element.getparent().text, parent, None, sibling_tag)
+            parent.text_done = True
+        if tag == COMMENT:
+            if parent is not None:
+                parent.children += 1
+            self.pending = (element, _Frame(COMMENT, parent))
+            return
+        if tag == "table":
+            self._marker("[TABLE]")
+
+        frame = _Frame(tag, parent)
+        if parent is not None:
+            parent.children += 1
+        self.stack.append(frame)
+        if frame.skip:
+            return
+
+        if tag in BUFFERED_TAGS:
+            frame.buffer = []
+        elif tag in ("ul", "ol"):
+            frame.nested = any(ancestor.tag == "li" for ancestor in self.stack[:-1])
+            if frame.nested:
+                frame.buffer = []
+        elif tag == "p":
+            frame.mark = len(self._sink())
+        elif tag == "table":
+            self._write("\n\n")
+        elif tag == "thead":
+            table = self._enclosing("table")
+            if table is not None:
+                table.has_thead = True
+        elif tag == "figcaption":
+            self._write("\n\n")
+
+    def _end(self, element):
+        self._flush_pending(None)
+        frame = self.stack[-1]
+        if not frame.text_done:
+            self._text(element.text, frame, None, None)
+            frame.text_done = True
+        self.stack.pop()
+        if not frame.skip:
+            self._close(frame, element)
+        self.pending = (element, frame)
+
+    def _enclosing(self, tag: str) -> Optional[_Frame]:
+        for frame in reversed(self.stack):
+            if frame.tag == tag:
+                return frame
+        return None
+
+    def _close(self, frame: _Frame, element):
+        tag = frame.tag
+        content = "".join(frame.buffer) if frame.buffer is not None else ""
+        parent = self.stack[-1] if self.stack else None
+
+        if tag in HEADING_TAGS:
+            if frame.as_inline:
+                self._write(content)
+            else:
+                self._write(f"{'#' * HEADING_TAGS[tag]} {content.strip()}\n\n")
+        elif tag in INLINE_MARKUP:
+            if tag in ("code", "kbd", "samp") and parent is not None and parent.tag == "pre":
+                self._write(content)
+            elif content.strip():
+                markup = INLINE_MARKUP[tag]
+                prefix = " " if content[0] == " " else ""
+                suffix = " " if content[-1] == " " else ""
+                self._write(f"{prefix}{markup}{content.strip()}{markup}{suffix}")
+        elif tag == "li":
+            if parent is not None and parent.tag == "ol":
+                bullet = f"{int_attribute(element.getparent(), 'start', 1) + frame.index}."
+            else:
+                depth = sum(1 for ancestor in self.stack if ancestor.tag == "ul") - 1
+                bullet = LIST_BULLETS[depth % len(LIST_BULLETS)]
+            self._write(f"{bullet} {content.strip()}\n")
+        elif tag in ("ul", "ol"):
+            if frame.nested:
+                indented = LINE_BEGINNING_RE.sub("\t", content) if content else ""
+                self._write("\n" + indented.rstrip())
+        elif tag in ("td", "th"):
+            colspan = int_attribute(element, "colspan", 1)
+            self._write(" " + content.strip().replace("\n", " ") + " |" * colspan)
+            row = self._enclosing("tr")
+            if row is not None:
+                row.cells.append(-colspan if tag == "th" else colspan)
+        elif tag == "tr":
+            self._write(self._table_row(frame, parent, content))
+        elif tag == "table":
+            self._write("\n")
+            self._marker("[/TABLE]")
+        elif tag == "blockquote":
+            if frame.as_inline:
+                self._write(content)
+            elif content:
+                self._write("\n" + LINE_BEGINNING_RE.sub("> ", content.strip()) + "\n\n")
+        elif tag == "p":
+            if not frame.as_inline and any(self._sink()[frame.mark:]):
+                self._write("\n\n")
+        elif tag == "pre":
+            if content:
+                self._write(f"\n```\n{content}\n```\n")
+        elif tag == "br":
+            self._write("" if frame.as_inline else "  \n")
+        elif tag == "hr":
+            self._write("\n\n---\n\n")
+        elif tag == "caption":
+            self._write("\n")
+        elif tag == "figcaption":
+            self._write("\n\n")
+
+    def _table_row(self, frame: _Frame, parent: Optional[_Frame], content: str) -> str:
+        parent_tag = parent.tag if parent is not None else ""
+        table = self._enclosing("table")
+        # Header cells are recorded with a negative colspan
+        is_headrow = (
+            all(cell < 0 for cell in frame.cells)
+            or (frame.first and parent_tag != "tbody")
+            or (frame.first and parent_tag == "tbody" and (table is None or not table.has_thead))
+        )
+        overline = ""
+        underline = ""
+        if is_headrow and frame.first:
+            full_colspan = sum(abs(cell) for cell in frame.cells)
+            underline = "| " + " | ".join(["---"] * full_colspan) + " |\n"
+        elif frame.first and (parent_tag == "table" or (parent_tag == "tbody" and parent.first)):
+            overline = "| " + " | ".join([""] * len(frame.cells)) + " |\n"
+            overline += "| " + " | ".join(["---"] * len(frame.cells)) + " |\n"
+        return overline + "|" + content + "\n" + underline
+
+    def _drain(self):
+        for event, element in self.parser.read_events():
+            if event in ("start", "comment"):
+                self._start(element)
+            else:
+                self._end(element)
+
+    def feed(self, chunk: bytes):
+        self.parser.feed(chunk)
+        self._drain()
+
+    def close(self) -> str:
+        self.parser.close()
+        self._drain()
+        self._flush_pending(None)
+        return "".join(self.output)
+
+
+def html_chunks_to_markdown(chunks: Iterable[bytes]) -> str:
+    """
+    Converts HTML delivered as a stream of byte chunks; parsing starts with the first chunk.
+    """
+    writer = StreamingMarkdownWriter()
+    for chunk in chunks:
+        writer.feed(chunk)
+    return re.sub(r"\n{2,}", "\n", writer.close())
@@ -1,16 +1,30 @@
 import os
 import logging
 import pdfplumber
-from PIL import Image
+import fitz
 import io
+from contextlib import ExitStack, contextmanager
+from typing import NamedTuple
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
-import gc
-import tempfile
 import pytesseract
-import logging
+import sys
+import threading
+import mmap
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 log_files_folder = os.environ.get("LOG_FILES_FOLDER")
+# OCR page workers for the whole host, shared out between the embedding processes that convert PDFs
+pdf_page_workers = int(os.environ.get("PDF_PAGE_WORKERS", multiprocessing.cpu_count()))
+pdf_parallel_min_pages = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 16))
+pdf_pages_per_shard = int(os.environ.get("PDF_PAGES_PER_SHARD", 8))
+pdf_worker_max_tasks = int(os.environ.get("PDF_WORKER_MAX_TASKS", 200))
+pdf_worker_max_rss_mb = int(os.environ.get("PDF_WORKER_MAX_RSS_MB", 2048))
 
 try:
     log_file_path = os.path.join(log_files_folder, "download.log")
@@ -24,10 +38,42 @@ except Exception as e:
     print(f"Failed to set up logging: {e}")
 
 
-def perform_ocr_on_image(image_path, ocr):
-    result = ocr.ocr(image_path, cls=True)
+_paddle_ocr = None
+_paddle_ocr_pid = None
+# The Paddle predictors are not thread-safe, so inference is serialised per process
+_paddle_ocr_lock = threading.Lock()
+
+
+def get_paddle_ocr():
+    """
+    Returns this process's PaddleOCR engine, loading the detection, recognition
+    and angle models on first use only.
+    """
+    global _paddle_ocr, _paddle_ocr_pid
+
+    pid = os.getpid()
+    if _paddle_ocr is None or _paddle_ocr_pid != pid:
+        with _paddle_ocr_lock:
+            if _paddle_ocr is None or _paddle_ocr_pid != pid:
+                from paddleocr import PaddleOCR
+
+                _paddle_ocr = PaddleOCR(use_angle_cls=True, lang="en", show_log=False)
+                _paddle_ocr_pid = pid
+                logging.info(f"Loaded PaddleOCR models in process {pid}")
+    return _paddle_ocr
+
+
+def warm_up_ocr():
+    """
+    Pool initializer that loads the OCR models before the worker takes its first PDF.
+    """
+    if os.environ.get("OCR_TYPE") == "PADDLE":
+        get_paddle_ocr()
+
+
+def paddle_result_to_text(result):
     text = ""
-    for line in result[0]:
+    for line in result[0] or []:
         if (
             isinstance(line, list)
             and len(line) > 1
@@ -38,288 +84,624 @@ def perform_ocr_on_image(image_path, ocr):
     return text.strip()
 
 
-def is_block_within_table(block_bbox, table_bbox):
-    x0, y0, x1, y1 = block_bbox
-    tx0, ty0, tx1, ty1 = table_bbox
-    return x0 < tx1 and x1 > tx0 and y0 < ty1 and y1 > ty0
+def image_to_ocr_array(image):
+    """
+    Converts a PIL image to the BGR uint8 array PaddleOCR reads from cv2, without encoding it.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    return np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1])
+
+
+def perform_ocr_on_image(image, ocr=None):
+    if ocr is None:
+        ocr = get_paddle_ocr()
+    image = image_to_ocr_array(image)
+    with _paddle_ocr_lock:
+        result = ocr.ocr(image, cls=True)
+    return paddle_result_to_text(result)
+
+
+def perform_ocr_on_images(images, ocr=None):
+    """
+    OCRs several cropped images in one call, holding the engine once for the
+    whole batch, and returns their texts in order.
+    """
+    if ocr is None:
+        ocr = get_paddle_ocr()
+    images = [image_to_ocr_array(image) for image in images]
+    with _paddle_ocr_lock:
+        results = [ocr.ocr(image, cls=True) for image in images]
+    return [paddle_result_to_text(result) for result in results]
+
+
+def open_pdf(pdf_content):
+    # Paths and memory-mapped PDFs are opened as they are; only bytes need a stream
+    if isinstance(pdf_content, (bytes, bytearray)):
+        pdf_content = io.BytesIO(pdf_content)
+    return pdfplumber.open(pdf_content)
+
+
+def assign_blocks_to_tables(blocks, table_bboxes):
+    """
+    Returns, for every word block, the index of the first table bbox it overlaps or -1,
+    testing all (block, table) pairs at once with NumPy.
+    """
+    if not blocks or not table_bboxes:
+        return [-1] * len(blocks)
+
+    block_bboxes = np.array(
+        [(block["x0"], block["top"], block["x1"], block["bottom"]) for block in blocks]
+    )
+    tables = np.array(table_bboxes)
+    overlaps = (
+        (block_bboxes[:, None, 0] < tables[None, :, 2])
+        & (block_bboxes[:, None, 2] > tables[None, :, 0])
+        & (block_bboxes[:, None, 1] < tables[None, :, 3])
+        & (block_bboxes[:, None, 3] > tables[None, :, 1])
+    )
+    first_table = overlaps.argmax(axis=1)
+    return np.where(overlaps.any(axis=1), first_table, -1).tolist()
+
+
+PAGE_TEXT_ONLY = "text_only"
+PAGE_TEXT_WITH_FIGURES = "text_with_figures"
+PAGE_SCANNED = "scanned"
+
+# Below this many text-layer characters a page with images is treated as scanned
+SCANNED_PAGE_MAX_CHARS = 20
+# A figure whose area already carries this much text-layer text is not OCRed
+FIGURE_TEXT_LAYER_MIN_CHARS = 100
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 300
+# Rendered glyph height, in pixels, that OCR reads reliably
+OCR_TARGET_GLYPH_PX = 30
+
+
+class PageTriage(NamedTuple):
+    kind: str
+    has_rulings: bool
+    ocr_dpi: int
+
+
+@contextmanager
+def open_fitz(pdf_content):
+    """
+    Opens the PDF with PyMuPDF for triage; yields None if it cannot, so pages are analysed fully.
+
+    PyMuPDF only reads streams from bytes, so other buffers such as memory maps are not triaged rather than
+    copied into memory. Large PDFs arrive as paths to the S3 cache file, which PyMuPDF opens from disk.
+    """
+    if not isinstance(pdf_content, (str, bytes, bytearray)):
+        yield None
+        return
+    try:
+        if isinstance(pdf_content, str):
+            fitz_doc = fitz.open(pdf_content)
+        else:
+            fitz_doc = fitz.open(stream=pdf_content, filetype="pdf")
+    except Exception as e:
+        logging.error(f"Error opening PDF with PyMuPDF for triage: {e}")
+        yield None
+        return
+
+    try:
+        yield fitz_doc
+    finally:
+        fitz_doc.close()
+
+
+def count_rulings(drawings):
+    horizontal = vertical = 0
+    for drawing in drawings:
+        for item in drawing["items"]:
+            if item[0] == "l":
+                (px0, py0), (px1, py1) = item[1], item[2]
+                horizontal += abs(py1 - py0) < 1
+                vertical += abs(px1 - px0) < 1
+            else:
+                # Rects, quads and curves all give pdfplumber both kinds of edges
+                horizontal += 2
+                vertical += 2
+    return horizontal, vertical
+
+
+def triage_page(fitz_page) -> PageTriage:
+    """
+    Classifies a page from its PyMuPDF text layer, images and vector drawings
+    so pdfplumber table detection and OCR only run where they can find something.
+    """
+    width, height = fitz_page.rect.width, fitz_page.rect.height
+    min_width = max(150, width * 0.3)
+    min_height = max(50, height * 0.1)
+
+    num_chars = 0
+    glyph_sizes = []
+    for block in fitz_page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                span_chars = len(span["text"].strip())
+                num_chars += span_chars
+                glyph_sizes += [span["size"]] * span_chars
+
+    images = fitz_page.get_image_info()
+    has_figures = any(
+        (image["bbox"][2] - image["bbox"][0]) >= min_width
+        and (image["bbox"][3] - image["bbox"][1]) >= min_height
+        for image in images
+    )
 
+    if num_chars < SCANNED_PAGE_MAX_CHARS and images:
+        kind = PAGE_SCANNED
+    elif has_figures:
+        kind = PAGE_TEXT_WITH_FIGURES
+    else:
+        kind = PAGE_TEXT_ONLY
+
+    # Figures on a born-digital page usually share its font sizes, so render
+    # them just large enough for the median glyph to reach the target height
+    ocr_dpi = OCR_MAX_DPI
+    if kind == PAGE_TEXT_WITH_FIGURES and glyph_sizes:
+        glyph_sizes.sort()
+        median_glyph = glyph_sizes[len(glyph_sizes) // 2]
+        ocr_dpi = int(OCR_TARGET_GLYPH_PX * 72 / max(median_glyph, 1))
+        ocr_dpi = min(OCR_MAX_DPI, max(OCR_MIN_DPI, ocr_dpi))
+
+    horizontal, vertical = count_rulings(fitz_page.get_cdrawings())
+    return PageTriage(kind, horizontal >= 2 and vertical >= 2, ocr_dpi)
+
+
+def triage_pages(fitz_doc, start, end) -> dict:
+    triages = {}
+    for page_num in range(start, end):
+        try:
+            triages[page_num] = triage_page(fitz_doc[page_num - 1])
+        except Exception as e:
+            logging.error(f"Error triaging PDF page {page_num}, analysing it fully: {e}")
+    return triages
+
+
+def has_text_layer_within(blocks, bbox):
+    x0, y0, x1, y1 = bbox
+    num_chars = 0
+    for block in blocks:
+        if (
+            block["x0"] >= x0
+            and block["x1"] <= x1
+            and block["top"] >= y0
+            and block["bottom"] <= y1
+        ):
+            num_chars += len(block["text"].strip())
+            if num_chars >= FIGURE_TEXT_LAYER_MIN_CHARS:
+                return True
+    return False
+
+
+def paddleocr_page_to_markdown(page, page_num, actual_url, ocr=None, triage=None):
+    markdown_parts = []
+    found_text = True
+    ocr_text = ""
+    if triage is None or triage.has_rulings:
+        found_tables = page.find_tables()
+        tables = [table.extract() for table in found_tables]
+        table_bboxes = [table.bbox for table in found_tables]
+        del found_tables
+    else:
+        tables, table_bboxes = [], []
+    printed_tables = set()
+    blocks = page.extract_words(use_text_flow=True, keep_blank_chars=True)
+    blocks_table_idx = assign_blocks_to_tables(blocks, table_bboxes)
+    for block, table_idx in zip(blocks, blocks_table_idx):
+        block["table_idx"] = table_idx
+    images = page.images if triage is None or triage.kind != PAGE_TEXT_ONLY else []
+    ocr_dpi = triage.ocr_dpi if triage is not None else OCR_MAX_DPI
+    all_elements = blocks + images
+
+    all_elements.sort(key=lambda b: b["top"] if "top" in b else b["y0"])
+
+    current_y = 0
+    line_parts = []
+    min_width = max(
+        150, page.width * 0.3
+    )  
+    min_height = max(
+        50, page.height * 0.1
+    ) 
+
+    for element in all_elements:
+        if "text" in element:  # Text blocks
+            block_text = element["text"].strip()
+
+            if element["top"] > current_y + 2:
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n")
+                    found_text = True
+                    line_parts = []
+                current_y = element["top"]
+
+            idx = element["table_idx"]
+            is_within_table = idx >= 0
+            if is_within_table and idx not in printed_tables:
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n\n")
+                    line_parts = []
+                df = pd.DataFrame(
+                    tables[idx][1:], columns=tables[idx][0]
+                )
+                markdown_table = tabulate(
+                    df, headers="keys", tablefmt="pipe", showindex=False
+                )
+                markdown_parts.append(f"[TABLE]\n{markdown_table}\n[/TABLE]\n\n")
+                found_text = True
+                printed_tables.add(idx)
+
+            if not is_within_table:
+                line_parts.append(block_text + " ")
+
+
+        elif "width" in element and "height" in element:  # Image blocks
+            x0, y0, x1, y1 = (
+                element["x0"],
+                element["top"],
+                element["x1"],
+                element["bottom"],
+            )
+            width, height = element["width"], element["height"]
+            page_bbox = (0, 0.0, page.width, page.height)
+            if width < min_width or height < min_height:
+                continue
+            if triage is not None and has_text_layer_within(blocks, (x0, y0, x1, y1)):
+                continue
+
+            if (
+                x0 >= page_bbox[0]
+                and x1 <= page_bbox[2]
+                and y0 >= page_bbox[1]
+                and y1 <= page_bbox[3]
+            ):
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n\n")
+                    line_parts = []
 
-def convert_pdf_to_markdown_using_paddleocr(file_path, actual_url):
-    from paddleocr import PaddleOCR
-
-    full_markdown = ""
-    ocr = PaddleOCR(use_angle_cls=True, lang="en", show_log=False)
-
-    with pdfplumber.open(io.BytesIO(file_path)) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            found_text = True
-            ocr_text = ""
-            tables = page.extract_tables()
-            table_bboxes = [table.bbox for table in page.find_tables()]
-            printed_tables = set()
-            blocks = page.extract_words(use_text_flow=True, keep_blank_chars=True)
-            images = page.images
-            all_elements = blocks + images
-
-            all_elements.sort(key=lambda b: b["top"] if "top" in b else b["y0"])
-
-            current_y = 0
-            line_text = ""
-            min_width = max(
-                150, page.width * 0.3
-            )  
-            min_height = max(
-                50, page.height * 0.1
-            ) 
-
-            for element in all_elements:
-                if "text" in element:  # Text blocks
-                    block_bbox = (
-                        element["x0"],
-                        element["top"],
-                        element["x1"],
-                        element["bottom"],
-                    )
-                    block_text = element["text"].strip()
-
-                    if element["top"] > current_y + 2:
-                        if line_text:
-                            full_markdown += line_text.strip() + "\n"
-                            found_text = True
-                            line_text = ""
-                        current_y = element["top"]
-
-                    is_within_table = False
-                    for idx, table_bbox in enumerate(table_bboxes):
-                        if is_block_within_table(block_bbox, table_bbox):
-                            is_within_table = True
-                            if idx not in printed_tables:
-                                if line_text:
-                                    full_markdown += line_text.strip() + "\n\n"
-                                    line_text = ""
-                                df = pd.DataFrame(
-                                    tables[idx][1:], columns=tables[idx][0]
-                                )
-                                markdown_table = tabulate(
-                                    df, headers="keys", tablefmt="pipe", showindex=False
-                                )
-                                full_markdown += (
-                                    f"[TABLE]\n{markdown_table}\n[/TABLE]\n\n"
-                                )
-                                found_text = True
-                                printed_tables.add(idx)
-                            break
-
-                    if not is_within_table:
-                        line_text += block_text + " "
-                        
-                        
-                elif "width" in element and "height" in element:  # Image blocks
-                    x0, y0, x1, y1 = (
-                        element["x0"],
-                        element["top"],
-                        element["x1"],
-                        element["bottom"],
-                    )
-                    width, height = element["width"], element["height"]
-                    page_bbox = (0, 0.0, page.width, page.height)
-                    if width < min_width or height < min_height:
-                        continue
-
-                    if (
-                        x0 >= page_bbox[0]
-                        and x1 <= page_bbox[2]
-                        and y0 >= page_bbox[1]
-                        and y1 <= page_bbox[3]
-                    ):
-                        if line_text:
-                            full_markdown += line_text.strip() + "\n\n"
-                            line_text = ""
-
-                        try:
-                            cropped_image = (
-                                page.within_bbox((x0, y0, x1, y1))
-                                .to_image(resolution=300)
-                                .original
-                            )
-                            img_byte_arr = io.BytesIO()
-                            cropped_image.save(img_byte_arr, format="PNG")
-                            img_byte_arr = img_byte_arr.getvalue()
-
-                            with tempfile.NamedTemporaryFile(
-                                delete=False, suffix=".png"
-                            ) as temp_file:
-                                temp_file.write(img_byte_arr)
-                                ocr_text = (
-                                    perform_ocr_on_image(temp_file.name, ocr) or ""
-                                )
-                                ocr_text = ocr_text.strip()
-                                if ocr_text.strip():
-                                    full_markdown += f"{ocr_text}\n"
-                                    found_text = True
-                            os.unlink(temp_file.name)
-                        except Exception as e:
-                            logging.error(
-                                f"Error processing PADDLE OCR PDF:- {actual_url} on Page Number: {page_num} image data for OCR: {e}"
-                            )
-
-            if (not found_text) and images:
                 try:
-                    page_image = page.to_image(resolution=300).original
-                    img_byte_arr = io.BytesIO()
-                    page_image.save(img_byte_arr, format="PNG")
-                    img_byte_arr = img_byte_arr.getvalue()
-
-                    with tempfile.NamedTemporaryFile(
-                        delete=False, suffix=".png"
-                    ) as temp_file:
-                        temp_file.write(img_byte_arr)
-                        ocr_text_full_page = (
-                            perform_ocr_on_image(temp_file.name, ocr) or ""
-                        )
-                        full_markdown += f"{ocr_text_full_page}\n"
-                    os.unlink(temp_file.name)
+                    cropped_image = (
+                        page.within_bbox((x0, y0, x1, y1))
+                        .to_image(resolution=ocr_dpi)
+                        .original
+                    )
+                    ocr_text = perform_ocr_on_image(cropped_image, ocr) or ""
+                    ocr_text = ocr_text.strip()
+                    if ocr_text.strip():
+                        markdown_parts.append(f"{ocr_text}\n")
+                        found_text = True
                 except Exception as e:
                     logging.error(
-                        f"Error performing PADDLE OCR for PDF {actual_url} on Page Number:- {page_num} for the entire page: {e}"
+                        f"Error processing PADDLE OCR PDF:- {actual_url} on Page Number: {page_num} image data for OCR: {e}"
                     )
 
-            if line_text:
-                full_markdown += line_text.strip()
+    if (not found_text) and images:
+        try:
+            page_image = page.to_image(resolution=ocr_dpi).original
+            ocr_text_full_page = perform_ocr_on_image(page_image, ocr) or ""
+            markdown_parts.append(f"{ocr_text_full_page}\n")
+        except Exception as e:
+            logging.error(
+                f"Error performing PADDLE OCR for PDF {actual_url} on Page Number:- {page_num} for the entire page: {e}"
+            )
+
+    if line_parts:
+        markdown_parts.append("".join(line_parts).strip())
+
+    return "".join(markdown_parts)
+
+
+def pytesseract_page_to_markdown(page, page_num, actual_url, ocr=None, triage=None):
+    markdown_parts = []
+    found_text = False
+    ocr_text = ""
+    if triage is None or triage.has_rulings:
+        found_tables = page.find_tables()
+        tables = [table.extract() for table in found_tables]
+        table_bboxes = [table.bbox for table in found_tables]
+        del found_tables
+    else:
+        tables, table_bboxes = [], []
+    printed_tables = set()
+    blocks = page.extract_words(use_text_flow=True, keep_blank_chars=True)
+    blocks_table_idx = assign_blocks_to_tables(blocks, table_bboxes)
+    for block, table_idx in zip(blocks, blocks_table_idx):
+        block["table_idx"] = table_idx
+    images = page.images if triage is None or triage.kind != PAGE_TEXT_ONLY else []
+    ocr_dpi = triage.ocr_dpi if triage is not None else OCR_MAX_DPI
+    all_elements = blocks + images
+
+    all_elements.sort(key=lambda b: b["top"] if "top" in b else b["y0"])
+
+    current_y = 0
+    line_parts = []
+    min_width = max(150, page.width * 0.3)
+    min_height = max(50, page.height * 0.1)
+    for element in all_elements:
+        if "text" in element:  # Text blocks
+            block_text = element["text"].strip()
+
+            if element["top"] > current_y + 2:
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n")
+                    line_parts = []
+                current_y = element["top"]
+
+            idx = element["table_idx"]
+            is_within_table = idx >= 0
+            if is_within_table and idx not in printed_tables:
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n\n")
+                    line_parts = []
+                df = pd.DataFrame(
+                    tables[idx][1:], columns=tables[idx][0]
+                )
+                markdown_table = tabulate(
+                    df, headers="keys", tablefmt="pipe", showindex=False
+                )
+                markdown_parts.append(f"[TABLE]\n{markdown_table}\n[/TABLE]\n\n")
+                printed_tables.add(idx)
+                found_text = True
+
+            if not is_within_table and block_text:
+                line_parts.append(block_text + " ")
+                found_text = True
+        elif "width" in element and "height" in element:  # Image blocks
+            x0, y0, x1, y1 = (
+                element["x0"],
+                element["top"],
+                element["x1"],
+                element["bottom"],
+            )
+            width, height = element["width"], element["height"]
+            page_bbox = (0, 0.0, page.width, page.height)
+            if width < min_width or height < min_height:
+                continue
+            if triage is not None and has_text_layer_within(blocks, (x0, y0, x1, y1)):
+                continue
+
+            if (
+                x0 >= page_bbox[0]
+                and x1 <= page_bbox[2]
+                and y0 >= page_bbox[1]
+                and y1 <= page_bbox[3]
+            ):
+                if line_parts:
+                    markdown_parts.append("".join(line_parts).strip() + "\n\n")
+                    line_parts = []
 
-            page.flush_cache()
-            page.get_textmap.cache_clear()
-            page.close()
-            del tables, table_bboxes, printed_tables, blocks, all_elements, images
-            gc.collect()
-
-    return full_markdown
-
-
-def convert_pdf_to_markdown_using_pytesseract(file_path, actual_url):
-    full_markdown = ""
-
-    with pdfplumber.open(io.BytesIO(file_path)) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            found_text = False
-            ocr_text = ""
-            tables = page.extract_tables()
-            table_bboxes = [table.bbox for table in page.find_tables()]
-            printed_tables = set()
-            blocks = page.extract_words(use_text_flow=True, keep_blank_chars=True)
-            images = page.images
-            all_elements = blocks + images
-
-            all_elements.sort(key=lambda b: b["top"] if "top" in b else b["y0"])
-
-            current_y = 0
-            line_text = ""
-            min_width = max(150, page.width * 0.3)
-            min_height = max(50, page.height * 0.1)
-            for element in all_elements:
-                if "text" in element:  # Text blocks
-                    block_bbox = (
-                        element["x0"],
-                        element["top"],
-                        element["x1"],
-                        element["bottom"],
+                try:
+                    cropped_image = (
+                        page.within_bbox((x0, y0, x1, y1))
+                        .to_image(resolution=ocr_dpi)
+                        .original
                     )
-                    block_text = element["text"].strip()
-
-                    if element["top"] > current_y + 2:
-                        if line_text:
-                            full_markdown += line_text.strip() + "\n"
-                            line_text = ""
-                        current_y = element["top"]
-
-                    is_within_table = False
-                    for idx, table_bbox in enumerate(table_bboxes):
-                        if is_block_within_table(block_bbox, table_bbox):
-                            is_within_table = True
-                            if idx not in printed_tables:
-                                if line_text:
-                                    full_markdown += line_text.strip() + "\n\n"
-                                    line_text = ""
-                                df = pd.DataFrame(
-                                    tables[idx][1:], columns=tables[idx][0]
-                                )
-                                markdown_table = tabulate(
-                                    df, headers="keys", tablefmt="pipe", showindex=False
-                                )
-                                full_markdown += (
-                                    f"[TABLE]\n{markdown_table}\n[/TABLE]\n\n"
-                                )
-                                printed_tables.add(idx)
-                                found_text = True
-                            break
-
-                    if not is_within_table and block_text:
-                        line_text += block_text + " "
+                    ocr_text = pytesseract.image_to_string(cropped_image) or ""
+                    if len(ocr_text) > 0:
                         found_text = True
-                elif "width" in element and "height" in element:  # Image blocks
-                    x0, y0, x1, y1 = (
-                        element["x0"],
-                        element["top"],
-                        element["x1"],
-                        element["bottom"],
-                    )
-                    width, height = element["width"], element["height"]
-                    page_bbox = (0, 0.0, page.width, page.height)
-                    if width < min_width or height < min_height:
-                        continue
-
-                    if (
-                        x0 >= page_bbox[0]
-                        and x1 <= page_bbox[2]
-                        and y0 >= page_bbox[1]
-                        and y1 <= page_bbox[3]
-                    ):
-                        if line_text:
-                            full_markdown += line_text.strip() + "\n\n"
-                            line_text = ""
-
-                        try:
-                            cropped_image = (
-                                page.within_bbox((x0, y0, x1, y1))
-                                .to_image(resolution=300)
-                                .original
-                            )
-
-                            img_byte_arr = io.BytesIO()
-                            cropped_image.save(img_byte_arr, format="PNG")
-                            img_byte_arr = img_byte_arr.getvalue()
-                            img = Image.open(io.BytesIO(img_byte_arr))
-                            ocr_text = pytesseract.image_to_string(img) or ""
-                            if len(ocr_text) > 0:
-                                found_text = True
-                            # print(f"ocr occured image-wise {page_num}")
-                            ocr_text = ocr_text.strip()
-                            # print(f"ocr text image-wise {ocr_text}")
-                            if ocr_text.strip():
-                                full_markdown += f" {ocr_text} "
-                        except Exception as e:
-                            logging.error(
-                                f"Error processing PYTESSERACT OCR PDF:-  Page Number: {page_num} image data for OCR: {e}"
-                            )
-
-            if (not found_text) and images:
-                try:
-                    # print(f"ocr occuring as a full page {page_num}")
-                    page_image = page.to_image(resolution=300).original
-                    ocr_text_full_page = pytesseract.image_to_string(page_image) or ""
-                    full_markdown += f" {ocr_text_full_page} "
-                    # print(f"ocr text page-wise {ocr_text_full_page}")
+                    # print(f"ocr occured image-wise {page_num}")
+                    ocr_text = ocr_text.strip()
+                    # print(f"ocr text image-wise {ocr_text}")
+                    if ocr_text.strip():
+                        markdown_parts.append(f" {ocr_text} ")
                 except Exception as e:
                     logging.error(
-                        f"Error performing PYTESSERACT OCR for PDF  on Page Number:- {page_num} for the entire page: {e}"
+                        f"Error processing PYTESSERACT OCR PDF:-  Page Number: {page_num} image data for OCR: {e}"
                     )
 
-            if line_text:
-                full_markdown += line_text.strip()
-            page.flush_cache()
-            page.get_textmap.cache_clear()
+    if (not found_text) and images:
+        try:
+            # print(f"ocr occuring as a full page {page_num}")
+            page_image = page.to_image(resolution=ocr_dpi).original
+            ocr_text_full_page = pytesseract.image_to_string(page_image) or ""
+            markdown_parts.append(f" {ocr_text_full_page} ")
+            # print(f"ocr text page-wise {ocr_text_full_page}")
+        except Exception as e:
+            logging.error(
+                f"Error performing PYTESSERACT OCR for PDF  on Page Number:- {page_num} for the entire page: {e}"
+            )
+
+    if line_parts:
+        markdown_parts.append("".join(line_parts).strip())
+    return "".join(markdown_parts)
+
+
+PAGE_CONVERTERS = {
+    "PADDLE": paddleocr_page_to_markdown,
+    "PYTESSERACT": pytesseract_page_to_markdown,
+}
+
+
+def convert_page_range(pdf, start, end, ocr_type, actual_url, fitz_doc=None):
+    """
+    Converts pages [start, end) (1-based) of an open PDF and returns their markdown in page order.
+
+    When a PyMuPDF handle on the same PDF is given, every page is triaged first
+    so born-digital pages skip table detection and OCR they do not need.
+    """
+    page_to_markdown = PAGE_CONVERTERS[ocr_type]
+    triages = triage_pages(fitz_doc, start, end) if fitz_doc is not None else {}
+    pages_markdown = []
+    for page_num in range(start, end):
+        page = pdf.pages[page_num - 1]
+        try:
+            pages_markdown.append(
+                page_to_markdown(
+                    page, page_num, actual_url, triage=triages.get(page_num)
+                )
+            )
+        finally:
+            # Drops the page's layout objects and char caches before the next page is parsed
             page.close()
-            del tables, table_bboxes, printed_tables, blocks, all_elements, images
-            gc.collect()
+            page.get_textmap.cache_clear()
+    return pages_markdown
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def convert_page_range_from_file(pdf_path, start, end, ocr_type, actual_url):
+    """
+    Page worker entry point: every shard maps the same temp file instead of
+    receiving the PDF bytes. Returns the pages' markdown and the worker's RSS
+    so the parent can recycle bloated workers.
+    """
+    with open(pdf_path, "rb") as pdf_file, open_fitz(pdf_path) as fitz_doc:
+        mapped = mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with open_pdf(mapped) as pdf:
+                pages_markdown = convert_page_range(
+                    pdf, start, end, ocr_type, actual_url, fitz_doc
+                )
+        finally:
+            mapped.close()
+    return pages_markdown, current_rss_bytes()
+
+
+# This process's share of PDF_PAGE_WORKERS
+_page_workers = pdf_page_workers
+_page_pool = None
+_page_pool_pid = None
+_page_pool_lock = threading.Lock()
+
+
+def init_pdf_converter_process(converter_processes):
+    """
+    Initializer of the embedding worker processes, called with the number of them running at once.
+    Each gets an equal share of PDF_PAGE_WORKERS, so the host never runs more OCR page workers than
+    that in total. A share of one, the floor, means the worker converts its PDFs itself without a page
+    pool, so only then are the OCR models loaded up front.
+    """
+    global _page_workers
+
+    _page_workers = max(1, pdf_page_workers // converter_processes)
+    logging.info(f"PDF page workers of this converter process: {_page_workers}")
+    if _page_workers == 1:
+        warm_up_ocr()
+
+
+def get_page_pool():
+    global _page_pool, _page_pool_pid
+
+    pid = os.getpid()
+    with _page_pool_lock:
+        if _page_pool is None or _page_pool_pid != pid:
+            pool_options = {}
+            if sys.version_info >= (3, 11):
+                pool_options["max_tasks_per_child"] = pdf_worker_max_tasks
+            # spawn, because the embedding workers that own this pool also run threads
+            _page_pool = ProcessPoolExecutor(
+                max_workers=_page_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up_ocr,
+                **pool_options,
+            )
+            _page_pool_pid = pid
+        return _page_pool
+
+
+def recycle_page_pool(wait=False):
+    global _page_pool
+
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=wait, cancel_futures=True)
+            _page_pool = None
+
+
+def convert_pdf_to_markdown_in_parallel(file_content, num_pages, ocr_type, actual_url):
+    """
+    Converts the PDF's page ranges on the page pool. Workers open the PDF by path, so a path to the
+    S3 cache file is passed on as is; only PDFs given as bytes or buffers go to a temp file first.
+    """
+    with ExitStack() as stack:
+        if isinstance(file_content, str):
+            pdf_path = file_content
+        else:
+            temp_file = stack.enter_context(tempfile.NamedTemporaryFile(suffix=".pdf"))
+            temp_file.write(file_content)
+            temp_file.flush()
+            pdf_path = temp_file.name
+
+        pool = get_page_pool()
+        try:
+            futures = [
+                pool.submit(
+                    convert_page_range_from_file,
+                    pdf_path,
+                    start,
+                    min(start + pdf_pages_per_shard, num_pages + 1),
+                    ocr_type,
+                    actual_url,
+                )
+                for start in range(1, num_pages + 1, pdf_pages_per_shard)
+            ]
+            shards = [future.result() for future in futures]
+        except BrokenProcessPool:
+            recycle_page_pool()
+            raise
+
+    peak_worker_rss = max(worker_rss for _, worker_rss in shards)
+    if peak_worker_rss > pdf_worker_max_rss_mb * 1024 * 1024:
+        logging.info(
+            f"Recycling PDF page workers at {peak_worker_rss // (1024 * 1024)} MB RSS after {actual_url}"
+        )
+        recycle_page_pool()
+
+    return "".join(
+        page_markdown for pages_markdown, _ in shards for page_markdown in pages_markdown
+    )
+
+
+def convert_pdf_to_markdown(file_content, actual_url, ocr_type):
+    """
+    Converts a PDF to the markdown consumed by CustomDocumentSplitter.
+
+    Long PDFs are sharded into page ranges that run on a pool of page workers;
+    the per-page markdown is stitched back in page order, so the output matches
+    a serial conversion.
+
+    file_content is the PDF's path, bytes or memory map. PyMuPDF is only opened
+    for triage when the pages are converted in this process.
+    """
+    with open_pdf(file_content) as pdf:
+        num_pages = len(pdf.pages)
+        if _page_workers <= 1 or num_pages < pdf_parallel_min_pages:
+            with open_fitz(file_content) as fitz_doc:
+                return "".join(
+                    convert_page_range(
+                        pdf, 1, num_pages + 1, ocr_type, actual_url, fitz_doc
+                    )
+                )
+
+    try:
+        return convert_pdf_to_markdown_in_parallel(
+            file_content, num_pages, ocr_type, actual_url
+        )
+    except BrokenProcessPool as e:
+        logging.error(
+            f"Page workers died while converting PDF {actual_url}, converting serially: {e}"
+        )
+        with open_pdf(file_content) as pdf, open_fitz(file_content) as fitz_doc:
+            return "".join(
+                convert_page_range(
+                    pdf, 1, num_pages + 1, ocr_type, actual_url, fitz_doc
+                )
+            )
 
-    return full_markdown
+
+def convert_pdf_to_markdown_using_paddleocr(file_path, actual_url):
+    return convert_pdf_to_markdown(file_path, actual_url, "PADDLE")
+
+
+def convert_pdf_to_markdown_using_pytesseract(file_path, actual_url):
+    return convert_pdf_to_markdown(file_path, actual_url, "PYTESSERACT")
@@ -4,7 +4,7 @@ import logging
 
 # Modules
 from crawling.Interfaces import InstituteIds
-from .utils import make_function_async
+from .utils import make_function_async, get_chunk_index, purge_stale_chunk_generations
 from .controller import extract_and_save_college_data
 from utils.auth_utils import check_token_middleware
 
@@ -21,3 +21,14 @@ async def save_college_data(item: InstituteIds):
     logging.info(f"Data extraction completed for IDs: {item.institute_ids}")
 
     return response
+
+
+@router.post(
+    "/purge_chunk_generations", dependencies=[Depends(check_token_middleware)]
+)
+async def purge_chunk_generations(index: str = "sentence"):
+    # Meant to be triggered off-peak; the deletes run as Elasticsearch tasks after the response
+    tasks = await make_function_async(
+        purge_stale_chunk_generations, get_chunk_index(index)
+    )
+    return {"tasks": tasks}
@@ -2,15 +2,18 @@
 import asyncio
 import os
 import re
+import time
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Dict, Any
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 import logging
 
 # Modules
 from crawling.utils import update_institute_generation_status
 from constants import es_institute_index_name
+from utils.elastic import activate_chunk_generation
 from .create_embeddings import process_all_documents
 
 # Initialization
@@ -28,6 +31,9 @@ chunk_index_by_word = os.environ.get("CHUNK_INDEX")
 chunk_index_by_sentence = os.environ.get("CHUNK_INDEX_SENTENCE")
 chunk_index_by_passage = os.environ.get("CHUNK_INDEX_PASSAGE")
 temp_dw_folder = os.environ.get("TEMP_DW_FOLDER")
+scrape_data_page_size = int(os.environ.get("SCRAPE_DATA_PAGE_SIZE", 1000))
+# Inactive generations younger than this may belong to a run still writing them, so the purge keeps them
+chunk_generation_grace_hours = float(os.environ.get("CHUNK_GENERATION_GRACE_HOURS", 24))
 
 
 def get_es_client(custom_settings: Dict[str, Any] = None) -> Elasticsearch:
@@ -79,58 +85,164 @@ def check_id_already_exists(inst_id):
             return True
 
 
-def fetch_scrape_data(inst_id):
+def fetch_scrape_data(inst_id, page_size=scrape_data_page_size):
+    """
+    Yields the `actual_url` and `s3_url` of every active scraped asset of the institute.
 
+    Results are paged with a point in time and search_after, so institutes with more than 10k assets are
+    read completely and the first page can be processed while the rest is still being fetched.
+    """
     query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"match": {"institute_id": inst_id}},
-                    {"match": {"status": True}},
-                ]
-            }
+        "bool": {
+            "must": [
+                {"match": {"institute_id": inst_id}},
+                {"match": {"status": True}},
+            ]
         }
     }
     with get_es_client() as esg:
-        result = esg.search(index="scraper_info", body=query, size=10000)
+        pit_id = esg.open_point_in_time(index="scraper_info", keep_alive="5m")["id"]
+        search_after = None
+        try:
+            while True:
+                result = esg.search(
+                    query=query,
+                    pit={"id": pit_id, "keep_alive": "5m"},
+                    sort=["_shard_doc"],
+                    search_after=search_after,
+                    source=["actual_url", "s3_url"],
+                    size=page_size,
+                )
+                hits = result["hits"]["hits"]
+                if not hits:
+                    break
+                pit_id = result["pit_id"]
+
+                for hit in hits:
+                    data = hit["_source"]
+                    yield {
+                        "actual_url": data["actual_url"],
+                        "s3_url": data["s3_url"],
+                    }
+
+                search_after = hits[-1]["sort"]
+        finally:
+            esg.close_point_in_time(id=pit_id)
+
+
+def new_chunk_generation():
+    # Millisecond timestamps keep generations increasing without a shared counter
+    return int(time.time() * 1000)
 
-    total = []
 
-    for hit in result["hits"]["hits"]:
-        data = hit["_source"]
-        total.append(
+def update_institute_embedding_status(inst_id, chunk_index):
+    # Switching to a new, empty generation takes every chunk of the institute out of retrieval at once;
+    # the old chunks are deleted by purge_stale_chunk_generations
+    activate_chunk_generation(inst_id, chunk_index, new_chunk_generation())
+
+
+def purge_stale_chunk_generations(chunk_index, batch_size=100, grace_hours=None):
+    """
+    Starts background delete_by_query tasks for chunks of every generation but their institute's active one.
+
+    Generations older than the active one are deleted straight away, and so are chunks without a generation once
+    the institute has one. Newer generations are left by failed or abandoned runs, or still being written by a
+    running one, so they are deleted once older than CHUNK_GENERATION_GRACE_HOURS. Returns the IDs of the
+    started tasks.
+    """
+    if grace_hours is None:
+        grace_hours = chunk_generation_grace_hours
+    # Generations are creation times in milliseconds
+    grace_cutoff = new_chunk_generation() - int(grace_hours * 3600 * 1000)
+    clauses = []
+    tasks = []
+
+    def start_task():
+        response = es.delete_by_query(
+            index=chunk_index,
+            query={"bool": {"should": clauses, "minimum_should_match": 1}},
+            conflicts="proceed",
+            slices="auto",
+            wait_for_completion=False,
+        )
+        tasks.append(response["task"])
+
+    for hit in helpers.scan(
+        es,
+        index=es_institute_index_name,
+        query={"query": {"exists": {"field": f"chunk_generations.{chunk_index}"}}},
+        _source=["cld_id", f"chunk_generations.{chunk_index}"],
+    ):
+        source = hit["_source"]
+        active_generation = source["chunk_generations"][chunk_index]
+        clauses.append(
             {
-                "actual_url": data["actual_url"],
-                "s3_url": data["s3_url"],
+                "bool": {
+                    "filter": [{"term": {"institute_id": source["cld_id"]}}],
+                    "must_not": [{"term": {"generation": active_generation}}],
+                    "should": [
+                        {"range": {"generation": {"lt": active_generation}}},
+                        {"range": {"generation": {"lt": grace_cutoff}}},
+                        {"bool": {"must_not": {"exists": {"field": "generation"}}}},
+                    ],
+                    "minimum_should_match": 1,
+                }
             }
         )
+        if len(clauses) >= batch_size:
+            start_task()
+            clauses = []
+    if clauses:
+        start_task()
 
-    return total
+    logging.info(f"Started {len(tasks)} purge tasks on {chunk_index}: {tasks}")
+    return tasks
 
 
-def update_institute_embedding_status(inst_id, chunk_index):
-    query = {
-        "script": {
-            "source": "ctx._source.status = params.new_status",
-            "lang": "painless",
-            "params": {"new_status": False},
-        },
-        "query": {
-            "bool": {
-                "must": [
-                    {"match": {"institute_id": inst_id}},
-                    {"match": {"status": True}},
-                ]
-            }
-        },
-    }
-    es.indices.refresh(index=chunk_index)
-    es.update_by_query(index=chunk_index, body=query)
+@contextmanager
+def suspended_refresh(chunk_index):
+    """
+    Disables periodic refresh on the chunk index for a bulk backfill, then restores it and refreshes once.
+
+    If refresh is already disabled, another backfill owns the setting and it is left untouched.
+    """
+    try:
+        settings = es.indices.get_settings(
+            index=chunk_index, name="index.refresh_interval"
+        )
+        index_settings = next(iter(settings.values()), {})
+        refresh_interval = (
+            index_settings.get("settings", {}).get("index", {}).get("refresh_interval")
+        )
+    except Exception as e:
+        logging.error(f"Could not read refresh interval of {chunk_index}: {e}")
+        yield
+        return
+
+    if refresh_interval == "-1":
+        logging.info(f"Refresh already suspended on {chunk_index}, leaving it as is")
+        yield
+        return
+
+    es.indices.put_settings(
+        index=chunk_index, settings={"index": {"refresh_interval": "-1"}}
+    )
+    logging.info(f"Suspended refresh on {chunk_index}")
+    try:
+        yield
+    finally:
+        # None resets the interval to the index default
+        es.indices.put_settings(
+            index=chunk_index, settings={"index": {"refresh_interval": refresh_interval}}
+        )
+        es.indices.refresh(index=chunk_index)
+        logging.info(f"Restored refresh interval {refresh_interval} on {chunk_index}")
 
 
 def generate_embedding(inst_id, chunk_index, index_type):
     try:
-        update_institute_embedding_status(inst_id, chunk_index)
+        # The current generation keeps serving retrieval until the new one is complete
+        generation = new_chunk_generation()
         institute_scraped_data = fetch_scrape_data(inst_id)
 
         # Create a new event loop for this process
@@ -138,15 +250,23 @@ def generate_embedding(inst_id, chunk_index, index_type):
         asyncio.set_event_loop(loop)
 
         # Run the coroutine in the new event loop
-        loop.run_until_complete(
+        written = loop.run_until_complete(
             process_all_documents(
                 scrape_data=institute_scraped_data,
                 inst_id=inst_id,
                 index_type=index_type,
                 index=chunk_index,
+                generation=generation,
             )
         )
 
+        if not written:
+            # Keep serving the current generation rather than switching to an empty one
+            return "Failure : No chunks written"
+
+        # Make the new generation searchable before switching to it, even while refresh is suspended
+        es.indices.refresh(index=chunk_index)
+        activate_chunk_generation(inst_id, chunk_index, generation)
         update_institute_generation_status(inst_id, True, "embedding_generated")
         return "Success"
 
@@ -8,14 +8,16 @@ from haystack_integrations.document_stores.elasticsearch import (
 import warnings
 import logging
 from .ouput_pipelines import (
-    query_pipeline_answer_builder,
     save_results_to_sheets,
 )
 from output_generation.save_results_to_es import (
     check_and_update_document_degree_initial_population,
 )
 from elasticsearch import Elasticsearch
-from output_generation.ouput_pipelines import add_answer_in_ip_answer
+from output_generation.ouput_pipelines import (
+    answer_prompt_jobs,
+    save_prompt_answers,
+)
 import json
 
 load_dotenv()  # Load the .env file
@@ -145,47 +147,6 @@ def fetch_degrees_run(es, inst_id):
         return set()
 
 
-def add_prompts_institute_entry_course(es, inst_id, prompt_id):
-    try:
-        search_result = es.search(
-            index=prompts_institute_index,
-            body={
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"term": {"prompt_id": prompt_id}},
-                            {"term": {"institute_id": inst_id}},
-                        ]
-                    }
-                }
-            },
-        )
-
-        if search_result["hits"]["total"]["value"] > 0:
-            doc_id = search_result["hits"]["hits"][0]["_id"]
-            update_response = es.update(
-                index=prompts_institute_index,
-                id=doc_id,
-                body={"doc": {"run_status": True, "status": True}},
-            )
-            return doc_id
-        else:
-            create_response = es.index(
-                index=prompts_institute_index,
-                body={
-                    "institute_id": inst_id,
-                    "prompt_id": prompt_id,
-                    "run_status": True,
-                    "status": True,
-                },
-            )
-            return create_response["_id"]
-
-    except Exception as e:
-        logging.error(f"Failed to ADD or UPDATE Prompts Institute Entry, {e}")
-        return None
-
-
 def run_query_pipeline_course_s(inst_id, index, course, course_cld_id, model="4o-mini"):
     """
     Initiates the process of running a query pipeline for multiple prompts, saving the results.
@@ -194,7 +155,7 @@ def run_query_pipeline_course_s(inst_id, index, course, course_cld_id, model="4o
     - inst_id (str): The identifier for the institution for which the pipeline is run.
     - model (str): The model to be used for answer generation. Values are 3.5t mixtral7b mixtral22b llama. number of chunks for llama is 7
     - index (str): The name of the Elasticsearch index to be used for document retrieval.
-    This function reads prompts from an Excel file, processes each using the query pipeline, and saves the results.
+    Prompts are answered concurrently by answer_prompt_jobs and their answers are saved together at the end.
     """
     document_store = ElasticsearchDocumentStore(
         hosts=es_host, index=index, basic_auth=(es_user, es_password)
@@ -203,25 +164,20 @@ def run_query_pipeline_course_s(inst_id, index, course, course_cld_id, model="4o
 
     es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
     prompts = fetch_course_prompts_from_es(es, "prompts")
-    new_prompt_status = False
-
-    ip_answer_objs = []
 
-    results = {}
     logging.info(
         f"Running course level query pipeline for institution ID: '{inst_id}' course '{course}' using model: '{model}'"
     )
+
+    def format_answer(tags):
+        return lambda answer: json.dumps({course_cld_id: {tags: answer}})
+
+    prompt_jobs = []
     for hit in prompts:
-        prompt_id = hit["_id"]
         source = hit["_source"]
+        prompt = None
         try:
             prompt = source["prompt"].replace("<course name>", course)
-            new_prompt_status = True
-
-            data_type = source["output_format"].replace("<course name>", course)
-            tags = source["tags"]
-            category = source["category"]
-            num_chunks = source["num_chunks"]
             if "search_terms" in source:
                 search_terms = source["search_terms"]
             else:
@@ -231,66 +187,27 @@ def run_query_pipeline_course_s(inst_id, index, course, course_cld_id, model="4o
             else:
                 response_type = "text"
             search_terms = search_terms + " " + course
-            results[prompt] = query_pipeline_answer_builder(
-                prompt,
-                inst_id,
-                data_type,
-                document_store,
-                search_terms=search_terms,
-                num_chunks=int(num_chunks),
-                model=model,
-                response_type=response_type,
-            )
-            results[prompt].update(
-                {"data_type": data_type, "tags": tags, "category": category}
-            )
-
-            answer_obj = (results[prompt]
-                        .get("answer_builder", {})
-                        .get("answers", [])[0]
-                        .data)
-            
-            answer_obj = json.loads(answer_obj)
-            actual_answer = answer_obj['answer']
-            sources = answer_obj['sources']
-
-            answer = json.dumps(
+            prompt_jobs.append(
                 {
-                    course_cld_id: {
-                        tags: actual_answer
-                    }
+                    "prompt_id": hit["_id"],
+                    "prompt": prompt,
+                    "data_type": source["output_format"].replace("<course name>", course),
+                    "tags": source["tags"],
+                    "search_terms": search_terms,
+                    "num_chunks": int(source["num_chunks"]),
+                    "response_type": response_type,
+                    "format_answer": format_answer(source["tags"]),
                 }
             )
-            documents = (
-                results[prompt]
-                .get("answer_builder", {})
-                .get("answers", [])[0]
-                .documents
-            )
-            original_links = []
-            source_links = []
-
-            for doc in documents:
-                if str(doc.id) in sources:
-                    source_links.append(doc.meta["file_url"])
-                original_links.append(doc.meta["file_url"])
-
-            ip_id = add_prompts_institute_entry_course(es, inst_id, prompt_id)
-            ip_answer_obj = add_answer_in_ip_answer(
-                es, ip_id, answer, data_type, original_links, tags, source_links
-            )
-            ip_answer_objs.append(ip_answer_obj)
-
         except Exception as e:
             logging.error(f"Error while running the prompt: {prompt} - {e}")
-            results[prompt] = {
-                "data_type": data_type,
-                "tags": tags,
-                "category": category,
-            }
+
+    prompt_answers = answer_prompt_jobs(prompt_jobs, inst_id, document_store, model)
 
     logging.info(
         f"Completed processing. Starting to save results for institution ID: '{inst_id}'"
     )
 
-    return ip_answer_objs
+    return save_prompt_answers(
+        es, inst_id, [entry for entry in prompt_answers if entry], update_existing=True
+    )
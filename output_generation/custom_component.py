@@ -1,38 +1,233 @@
 from haystack.dataclasses import Document
-from typing import List
+from typing import Any, Dict, List, Optional
 from haystack import component
-from utils.auth_utils import get_response_from_gpt
+from haystack.components.embedders import OpenAITextEmbedder
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from utils.auth_utils import (
+    get_response_from_gpt,
+    get_response_from_gpt_with_system,
+    llm_request_slots,
+)
+from utils.query_embedding_cache import get_query_embedding
+
+# SEQUENTIAL, the default, is the original one-call-at-a-time behaviour. Opt-in modes: BATCH judges all chunks of a
+# retriever in one call, PARALLEL runs the per-chunk yes/no calls concurrently, LOCAL uses LocalChunkRelevanceFilter
+# instead of the LLM
+chunk_relevance_mode = os.environ.get("CHUNK_RELEVANCE_MODE", "SEQUENTIAL").upper()
+# Per-chunk calls in flight across every pipeline of the process
+chunk_relevance_concurrency = int(os.environ.get("CHUNK_RELEVANCE_CONCURRENCY", 8))
+
+chunk_relevance_model_path = os.environ.get(
+    "CHUNK_RELEVANCE_MODEL_PATH", "chunk_relevance_model.joblib"
+)
+
+_relevance_executor = ThreadPoolExecutor(max_workers=chunk_relevance_concurrency)
+_relevance_models = {}
+_relevance_models_lock = threading.Lock()
+
+BATCH_RELEVANCE_SYSTEM_PROMPT = "You are a helpful assistant that Understands a user query and tells which contexts can answer it. Respond only with JSON."
 """
 This is Custom Haystack Component which takes retrieved chunks from ElasticEmbedding and BM25 retriever and Prints It.
 This chunks Can be further manipulated in any way possible and Return desired chunks.
 """
 @component
 class AIChunkCompressing:
-    def __init__(self, name: str, query: str, inst_id : int):
+    def __init__(self, name: str, mode: Optional[str] = None):
         self.name = name
-        self.query = query
-        self.inst_id = inst_id
+        self.mode = (mode or chunk_relevance_mode).upper()
 
     @component.output_types(chunks=List[Document])
-    def run(self, chunks: List[Document]):
+    def run(self, chunks: List[Document], query: str):
+        if not chunks:
+            return {"chunks": []}
+
+        if self.mode == "BATCH":
+            try:
+                return {"chunks": self.filter_batch(chunks, query)}
+            except Exception as e:
+                logging.error(f"{self.name}: batched relevance check failed, checking chunks one by one: {e}")
+            return {"chunks": self.filter_parallel(chunks, query)}
+        elif self.mode == "PARALLEL":
+            return {"chunks": self.filter_parallel(chunks, query)}
+
         updated_chunks = []
-        for i, chunk in enumerate(chunks, 1):
-            content = chunk.content
-            prompt = f"""
+        for chunk in chunks:
+            if self.is_relevant(chunk, query):
+                updated_chunks.append(chunk)
+
+        return {"chunks": updated_chunks}
+
+    def is_relevant(self, chunk: Document, query: str) -> bool:
+        content = chunk.content
+        prompt = f"""
                         You are given a query and context. 
                         Determine whether the context contains information that can answer the query. 
                         Respond only with "Yes" or "No", and do not include any additional explanation.
 
                         ### Query Start
-                        {self.query}
+                        {query}
                         ### Query End
 
                         ### Context Start
                         {content}
                         ### Context End
                     """
-            answer = get_response_from_gpt(prompt)
-            if answer.lower() == 'yes':
-                updated_chunks.append(chunk)     
+        answer = get_response_from_gpt(prompt)
+        return answer.lower() == 'yes'
 
-        return {"chunks": updated_chunks}
+    def filter_parallel(self, chunks: List[Document], query: str) -> List[Document]:
+        # map keeps the retriever's order
+        relevant = _relevance_executor.map(lambda chunk: self.is_relevant(chunk, query), chunks)
+        return [chunk for chunk, keep in zip(chunks, relevant) if keep]
+
+    def filter_batch(self, chunks: List[Document], query: str) -> List[Document]:
+        contexts = "\n\n".join(
+            f"### Context {i} Start\n{chunk.content}\n### Context {i} End"
+            for i, chunk in enumerate(chunks)
+        )
+        prompt = f"""
+                        You are given a query and {len(chunks)} numbered contexts. 
+                        For each context, determine whether it contains information that can answer the query. 
+                        Respond only with a JSON object of the form {{"relevant": [numbers of the contexts that can answer the query]}}, and do not include any additional explanation.
+
+                        ### Query Start
+                        {query}
+                        ### Query End
+
+{contexts}
+                    """
+        answer = get_response_from_gpt_with_system(prompt, BATCH_RELEVANCE_SYSTEM_PROMPT)
+        # Models sometimes wrap the object in a code fence
+        relevant_ids = json.loads(re.search(r"\{.*\}", answer, re.DOTALL).group(0))["relevant"]
+        relevant_ids = {int(i) for i in relevant_ids}
+        return [chunk for i, chunk in enumerate(chunks) if i in relevant_ids]
+
+
+def get_query_terms(text):
+    return set(re.findall(r"\w{3,}", text.lower()))
+
+
+def get_chunk_relevance_features(chunks: List[Document], query: str, query_embedding: Optional[List[float]] = None):
+    """
+    Returns one feature row per chunk of a retriever's result list: score relative to the best hit, relative rank,
+    share of query terms in the chunk, cosine similarity to the query embedding and chunk length.
+
+    Chunks from an in-memory working set have no embedding and carry their similarity in meta["query_similarity"].
+    """
+    query_terms = get_query_terms(query)
+    max_score = max((chunk.score or 0) for chunk in chunks) or 1
+    query_vector = None
+    if query_embedding is not None:
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1)
+
+    rows = []
+    for rank, chunk in enumerate(chunks):
+        content = chunk.content or ""
+        overlap = len(query_terms & get_query_terms(content)) / len(query_terms) if query_terms else 0
+        similarity = chunk.meta.get("query_similarity", 0)
+        if query_vector is not None and chunk.embedding:
+            chunk_vector = np.asarray(chunk.embedding, dtype=np.float32)
+            if chunk_vector.shape == query_vector.shape:
+                similarity = float(chunk_vector @ query_vector / (np.linalg.norm(chunk_vector) or 1))
+        rows.append(
+            [(chunk.score or 0) / max_score, rank / len(chunks), overlap, similarity, min(len(content) / 4000, 1)]
+        )
+    return np.array(rows, dtype=np.float32)
+
+
+def load_chunk_relevance_model(model_path):
+    # Only LOCAL mode needs joblib, so it is imported on first load
+    import joblib
+
+    # Both filters of every pipeline in the process share one loaded model
+    with _relevance_models_lock:
+        if model_path not in _relevance_models:
+            _relevance_models[model_path] = joblib.load(model_path)
+        return _relevance_models[model_path]
+
+
+@component
+class LocalChunkRelevanceFilter:
+    """
+    Drop-in replacement for AIChunkCompressing that judges relevance on CPU.
+
+    A classifier trained on the LLM judge's verdicts by `python -m output_generation.train_chunk_relevance`
+    scores each chunk from the features of get_chunk_relevance_features, and chunks at or above the learned
+    threshold are kept.
+    """
+
+    def __init__(self, name: str, model_path: Optional[str] = None):
+        self.name = name
+        self.model_path = model_path or chunk_relevance_model_path
+        self.model = None
+
+    def warm_up(self):
+        if self.model is None:
+            self.model = load_chunk_relevance_model(self.model_path)
+
+    @component.output_types(chunks=List[Document])
+    def run(self, chunks: List[Document], query: str, query_embedding: Optional[List[float]] = None):
+        if not chunks:
+            return {"chunks": []}
+        self.warm_up()
+
+        start_time = time.perf_counter()
+        features = get_chunk_relevance_features(chunks, query, query_embedding)
+        probabilities = self.model["classifier"].predict_proba(features)[:, 1]
+        kept = [chunk for chunk, probability in zip(chunks, probabilities) if probability >= self.model["threshold"]]
+        logging.info(
+            f"{self.name}: kept {len(kept)} of {len(chunks)} chunks locally in "
+            f"{(time.perf_counter() - start_time) * 1000:.1f} ms"
+        )
+        return {"chunks": kept}
+
+
+@component
+class DocumentLimiter:
+    """
+    Keeps the first top_k documents, so the number of chunks can change per prompt without rebuilding the joiner.
+    """
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document], top_k: Optional[int] = None):
+        if top_k:
+            documents = documents[:top_k]
+        return {"documents": documents}
+
+
+@component
+class CachedTextEmbedder:
+    """
+    Wraps an OpenAITextEmbedder with the query embedding cache, so search terms repeated across institutes are
+    embedded once.
+    """
+
+    def __init__(self, embedder: OpenAITextEmbedder):
+        self.embedder = embedder
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        return {"embedding": get_query_embedding(self.embedder, text), "meta": {}}
+
+
+@component
+class RateLimitedGenerator:
+    """
+    Wraps a generator so its calls take a slot of the process-wide LLM request limit, like the relevance checks do.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    def run(self, prompt: str, generation_kwargs: Optional[Dict[str, Any]] = None):
+        with llm_request_slots:
+            return self.generator.run(prompt=prompt, generation_kwargs=generation_kwargs)
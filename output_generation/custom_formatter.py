@@ -0,0 +1,177 @@
+import html
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from haystack import component
+from haystack.components.builders.prompt_builder import PromptBuilder
+
+NO_ANSWER = "I do not have that information."
+
+# response_format of the answer LLM in single-call mode; the answer is always text and formatted locally
+ANSWER_JSON_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "college_answer",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "answer": {"type": "string"},
+                "sources": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["answer", "sources"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def get_answer_format_type(answer_data_type):
+    """
+    Maps a prompt's free-text output_format to the format post_format_answer handles, or None for plain text
+    and formats it doesn't know.
+    """
+    data_type = (answer_data_type or "").lower()
+    if "table" in data_type:
+        return "html_table"
+    if "json" in data_type:
+        return "json"
+    if re.search(r"\byes\b", data_type) and re.search(r"\bno\b", data_type):
+        return "yes_no"
+    if "list" in data_type:
+        return "list"
+    return None
+
+
+def parse_answer_reply(reply):
+    """
+    Parses the answer LLM's reply into its answer and source ids.
+
+    :raises ValueError: If the reply doesn't match ANSWER_JSON_SCHEMA.
+    """
+    # Models sometimes wrap the object in a code fence
+    match = re.search(r"\{.*\}", reply or "", re.DOTALL)
+    if not match:
+        raise ValueError("reply is not a JSON object")
+    reply_obj = json.loads(match.group(0))
+    if not isinstance(reply_obj, dict) or "answer" not in reply_obj:
+        raise ValueError("reply has no answer")
+    sources = reply_obj.get("sources", [])
+    if not isinstance(sources, list):
+        raise ValueError("sources is not a list")
+    return reply_obj["answer"], [str(source) for source in sources]
+
+
+def _list_items(answer):
+    if isinstance(answer, list):
+        items = [item if isinstance(item, str) else json.dumps(item) for item in answer]
+    else:
+        items = [re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line) for line in str(answer).splitlines()]
+    return [item.strip() for item in items if item.strip()]
+
+
+def _html_table(answer):
+    if isinstance(answer, list) and answer and all(isinstance(row, dict) for row in answer):
+        columns = list(dict.fromkeys(key for row in answer for key in row))
+        header = "".join(f"<th>{html.escape(str(column))}</th>" for column in columns)
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{html.escape(str(row.get(column, '')))}</td>" for column in columns) + "</tr>"
+            for row in answer
+        )
+        return f"<table><tr>{header}</tr>{rows}</table>"
+
+    match = re.search(r"<table.*?</table>", str(answer), re.DOTALL | re.IGNORECASE)
+    if not match or not BeautifulSoup(match.group(0), "html.parser").find("tr"):
+        raise ValueError("answer has no HTML table")
+    return match.group(0)
+
+
+def post_format_answer(answer, answer_data_type):
+    """
+    Formats an answer for its output_format without an LLM, as the answer formatter LLM would.
+
+    Lists become arrays of strings, HTML tables are cut out of the surrounding text (or built from a list of
+    rows), yes/no answers become "Yes" or "No" and JSON answers are parsed. Other formats are kept as written,
+    since the answer LLM was already given the format.
+
+    :raises ValueError: If the answer can't be put into the format.
+    """
+    if isinstance(answer, str):
+        answer = answer.strip()
+        if answer == NO_ANSWER:
+            return answer
+
+    format_type = get_answer_format_type(answer_data_type)
+    if format_type == "list":
+        return _list_items(answer)
+    if format_type == "html_table":
+        return _html_table(answer)
+    if format_type == "yes_no":
+        if isinstance(answer, bool):
+            return "Yes" if answer else "No"
+        first_word = re.match(r"\W*(\w+)", str(answer))
+        if first_word and first_word.group(1).lower() in ("yes", "no"):
+            return first_word.group(1).capitalize()
+        raise ValueError("answer is neither yes nor no")
+    if format_type == "json":
+        if isinstance(answer, (dict, list)):
+            return answer
+        match = re.search(r"[\[{].*[\]}]", answer, re.DOTALL)
+        if not match:
+            raise ValueError("answer is not JSON")
+        return json.loads(match.group(0))
+    return answer
+
+
+@component
+class StructuredAnswerFormatter:
+    """
+    Replaces the answer formatter LLM when the answer LLM already answers in the requested format.
+
+    The reply is validated against ANSWER_JSON_SCHEMA and its answer formatted by post_format_answer. Only when
+    either fails is the reply handed to the formatter LLM, as the two-call pipeline does for every prompt.
+    """
+
+    def __init__(self, fallback_template: str, fallback_generator):
+        """
+        :param fallback_template: Prompt template of the formatter LLM.
+        :param fallback_generator: The formatter LLM.
+        """
+        self.fallback_prompt_builder = PromptBuilder(template=fallback_template)
+        self.fallback_generator = fallback_generator
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    def run(
+        self,
+        replies: List[str],
+        answer_data_type: str,
+        query: str,
+        meta: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        Formats the answer LLM's reply.
+
+        :param replies: Replies of the answer LLM, of which the first is formatted.
+        :param answer_data_type: The prompt's output_format.
+        :param query: The prompt, for the formatter LLM.
+        :param meta: Meta of the answer LLM's replies.
+
+        :returns: A dictionary with the following keys:
+            - `replies`: The formatted reply, a JSON object with answer and sources.
+            - `meta`: Meta of the LLM call that produced the reply.
+        """
+        reply = replies[0] if replies else ""
+        try:
+            answer, sources = parse_answer_reply(reply)
+            answer = post_format_answer(answer, answer_data_type)
+            return {"replies": [json.dumps({"answer": answer, "sources": sources})], "meta": meta or [{}]}
+        except Exception as e:
+            logging.info(f"Answer to '{query}' not formatted locally ({e}), using the formatter LLM")
+
+        prompt = self.fallback_prompt_builder.run(
+            query=query, results=replies, answer_data_type=answer_data_type
+        )["prompt"]
+        return self.fallback_generator.run(prompt=prompt)
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+from haystack import Document, component
+from haystack_bm25.rank_bm25 import BM25L
+
+# Serve each institute's retrieval from its chunks held in memory instead of searching Elasticsearch per prompt
+institute_working_set_mode = os.environ.get("INSTITUTE_WORKING_SET", "false").lower() == "true"
+# Memory the cached working sets may take together; a set of a few thousand 3072-dim chunks takes around
+# 100 MB, and each load logs its size
+working_set_cache_bytes = int(os.environ.get("WORKING_SET_CACHE_MB", 512)) * 1024 * 1024
+
+_working_sets = OrderedDict()
+_working_sets_lock = threading.Lock()
+_working_set_loading_locks = {}
+
+
+def tokenize(text):
+    # Same token pattern as haystack's InMemoryDocumentStore
+    return re.findall(r"(?u)\b\w\w+\b", (text or "").lower())
+
+
+class InstituteWorkingSet:
+    """
+    The active chunks of one institute, with their vectors in a normalised matrix and their content in a BM25
+    index, so retrieval for the institute's prompts needs no Elasticsearch request.
+
+    Scores follow Elasticsearch: kNN scores are (1 + cosine) / 2 and BM25 only returns chunks sharing a term
+    with the query. BM25 is computed over chunk content with BM25L, the default of haystack's in-memory store,
+    so ranks can differ slightly from Elasticsearch's fuzzy multi-field match.
+
+    Vectors are only kept in the matrix, so returned chunks have no embedding. Their cosine similarity to the
+    query is given in the "query_similarity" meta field instead, which LocalChunkRelevanceFilter reads.
+    """
+
+    def __init__(self, documents: List[Document], embeddings: Optional[List[Any]] = None):
+        """
+        :param documents: The chunks.
+        :param embeddings: The chunks' vectors, if not given as the documents' embeddings.
+        """
+        if embeddings is None:
+            embeddings = [doc.embedding for doc in documents]
+        dims = next((len(embedding) for embedding in embeddings if embedding is not None), 0)
+        vectors = np.zeros((len(documents), dims), dtype=np.float32)
+        for i, embedding in enumerate(embeddings):
+            if embedding is not None and len(embedding) == dims:
+                vectors[i] = embedding
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+        # A float list takes about 8 times the memory of its matrix row
+        self.documents = [replace(doc, embedding=None) for doc in documents]
+        self.bm25 = BM25L([tokenize(doc.content) for doc in documents]) if documents else None
+        self.nbytes = self._estimate_nbytes()
+
+    def _estimate_nbytes(self):
+        nbytes = self.vectors.nbytes + sum(sys.getsizeof(doc.content or "") for doc in self.documents)
+        if self.bm25:
+            nbytes += sum(
+                sys.getsizeof(freqs) + sum(sys.getsizeof(term) for term in freqs) for freqs in self.bm25.doc_freqs
+            )
+        return nbytes
+
+    @classmethod
+    def load(cls, client, index, filters):
+        documents = []
+        embeddings = []
+        for hit in helpers.scan(
+            client, index=index, query={"query": {"bool": {"filter": filters}}}, size=1000
+        ):
+            # Converted as they arrive, so the float lists of all chunks are never held at once
+            embedding = hit["_source"].pop("embedding", None)
+            embeddings.append(None if embedding is None else np.asarray(embedding, dtype=np.float32))
+            documents.append(Document.from_dict(hit["_source"]))
+        return cls(documents, embeddings)
+
+    def _top(self, scores, top_k, similarities):
+        top_k = min(top_k, len(scores))
+        if not top_k:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        # Copies, as the joiner overwrites scores
+        return [
+            replace(
+                self.documents[i],
+                score=float(scores[i]),
+                meta={**self.documents[i].meta, "query_similarity": float(similarities[i])},
+            )
+            for i in top
+        ]
+
+    def similarities(self, query_embedding):
+        # Cosine similarity of every chunk to the query
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        if query_vector.shape != self.vectors.shape[1:]:
+            return np.zeros(len(self.documents), dtype=np.float32)
+        return self.vectors @ (query_vector / (np.linalg.norm(query_vector) or 1))
+
+    def embedding_retrieval(self, similarities, top_k):
+        if not self.documents:
+            return []
+        return self._top((1 + similarities) / 2, top_k, similarities)
+
+    def bm25_retrieval(self, query, similarities, top_k):
+        if not self.documents:
+            return []
+        query_terms = tokenize(query)
+        scores = np.asarray(self.bm25.get_scores(query_terms), dtype=np.float32)
+        # BM25L gives every chunk a score, Elasticsearch only returns chunks matching a term
+        matching = np.array([any(term in freqs for term in query_terms) for freqs in self.bm25.doc_freqs])
+        return self._top(np.where(matching, scores, -np.inf), min(top_k, int(matching.sum())), similarities)
+
+
+def get_institute_working_set(client, index, filters):
+    """
+    Returns the working set of the chunks matching the filters, loading it on first use.
+
+    The filters name the institute and its active chunk generation, so a new generation gets a new working set.
+    Prompts of an institute run concurrently, so concurrent callers wait for a single load.
+    """
+    key = (index, json.dumps(filters, sort_keys=True))
+    with _working_sets_lock:
+        loading_lock = _working_set_loading_locks.setdefault(key, threading.Lock())
+
+    with loading_lock:
+        with _working_sets_lock:
+            working_set = _working_sets.get(key)
+            if working_set is not None:
+                _working_sets.move_to_end(key)
+                return working_set
+
+        start_time = time.perf_counter()
+        working_set = InstituteWorkingSet.load(client, index, filters)
+        logging.info(
+            f"Loaded working set of {len(working_set.documents)} chunks "
+            f"({working_set.nbytes / 1024 / 1024:.0f} MB) from {index} for {filters} in "
+            f"{time.perf_counter() - start_time:.1f} s"
+        )
+        with _working_sets_lock:
+            _working_sets[key] = working_set
+            # The newest set stays even when it alone is over the limit, as the institute's prompts use it next
+            while (
+                len(_working_sets) > 1
+                and sum(cached.nbytes for cached in _working_sets.values()) > working_set_cache_bytes
+            ):
+                _working_sets.popitem(last=False)
+            _working_set_loading_locks.pop(key, None)
+        return working_set
+
+
+@component
+class ElasticsearchHybridRetriever:
+    """
+    Retrieves chunks by embedding similarity and by BM25 with one `msearch` request instead of two searches.
+
+    The requests match those of `ElasticsearchEmbeddingRetriever` and `ElasticsearchBM25Retriever`, except that
+    filters are Elasticsearch filter clauses used as-is, so `term` queries on keyword fields run in filter
+    context and are cached across prompts. Both result lists are returned separately, as the relevance checks
+    judge each list before the joiner fuses them.
+
+    In working set mode, the chunks matching the filters are loaded once into an `InstituteWorkingSet` and both
+    searches run in memory.
+    """
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index: str,
+        top_k: int = 20,
+        num_candidates: Optional[int] = None,
+        fuzziness: str = "AUTO",
+        working_set: Optional[bool] = None,
+    ):
+        """
+        :param client: The Elasticsearch client both searches and working set loads run on.
+        :param index: The chunk index.
+        :param top_k: Maximum number of chunks each search returns.
+        :param num_candidates: kNN candidates per shard. Defaults to top_k * 10, like the embedding retriever.
+        :param fuzziness: Fuzziness of the BM25 query.
+        :param working_set: Search in-memory working sets. Defaults to the INSTITUTE_WORKING_SET setting.
+        """
+        self.client = client
+        self.index = index
+        self.top_k = top_k
+        self.num_candidates = num_candidates
+        self.fuzziness = fuzziness
+        self.working_set = institute_working_set_mode if working_set is None else working_set
+
+    @component.output_types(embedding_documents=List[Document], bm25_documents=List[Document])
+    def run(
+        self,
+        query: str,
+        query_embedding: List[float],
+        filters: Optional[List[Dict[str, Any]]] = None,
+        top_k: Optional[int] = None,
+    ):
+        """
+        Runs both searches.
+
+        :param query: Text of the BM25 search.
+        :param query_embedding: Embedding of the kNN search.
+        :param filters: Elasticsearch filter clauses applied to both searches.
+        :param top_k: Overrides the top_k given at initialisation.
+
+        :returns: A dictionary with the following keys:
+            - `embedding_documents`: Chunks found by the kNN search.
+            - `bm25_documents`: Chunks found by the BM25 search.
+        """
+        top_k = top_k or self.top_k
+        filters = filters or []
+        if self.working_set:
+            working_set = get_institute_working_set(self.client, self.index, filters)
+            similarities = working_set.similarities(query_embedding)
+            return {
+                "embedding_documents": working_set.embedding_retrieval(similarities, top_k),
+                "bm25_documents": working_set.bm25_retrieval(query, similarities, top_k),
+            }
+
+        knn_search = {
+            "size": top_k,
+            "knn": {
+                "field": "embedding",
+                "query_vector": query_embedding,
+                "k": top_k,
+                "num_candidates": self.num_candidates or top_k * 10,
+                "filter": filters,
+            },
+        }
+        bm25_search = {
+            "size": top_k,
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fuzziness": self.fuzziness,
+                                "type": "most_fields",
+                                "operator": "OR",
+                            }
+                        }
+                    ],
+                    "filter": filters,
+                }
+            },
+        }
+
+        response = self.client.msearch(
+            searches=[{"index": self.index}, knn_search, {"index": self.index}, bm25_search]
+        )
+        embedding_documents, bm25_documents = (
+            self._to_documents(result) for result in response["responses"]
+        )
+        return {"embedding_documents": embedding_documents, "bm25_documents": bm25_documents}
+
+    def _to_documents(self, result):
+        if "error" in result:
+            logging.error(f"Hybrid retrieval on {self.index} failed: {result['error']}")
+            raise RuntimeError(f"Search on {self.index} failed: {result['error']}")
+        return [
+            Document.from_dict({**hit["_source"], "score": hit["_score"]})
+            for hit in result["hits"]["hits"]
+        ]
@@ -1,8 +1,4 @@
 from datetime import datetime
-from haystack_integrations.components.retrievers.elasticsearch import (
-    ElasticsearchEmbeddingRetriever,
-    ElasticsearchBM25Retriever,
-)
 from haystack.components.embedders import OpenAITextEmbedder
 from haystack.components.joiners import DocumentJoiner
 from haystack.components.builders.prompt_builder import PromptBuilder
@@ -12,6 +8,9 @@ from haystack import Pipeline
 from haystack.utils import Secret
 from dotenv import load_dotenv
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import pandas as pd
 from haystack_integrations.document_stores.elasticsearch import (
     ElasticsearchDocumentStore,
@@ -22,8 +21,25 @@ from oauth2client.service_account import ServiceAccountCredentials
 import gspread
 import warnings
 import logging
-from utils.elastic import update_prompts_institute
-from .custom_component import AIChunkCompressing 
+from utils.elastic import update_prompts_institute, get_active_chunk_generation
+from utils.embedding_profiles import get_embedder_params
+from utils.answer_cache import (
+    get_cache_key,
+    get_cached_answer,
+    get_context_fingerprint,
+    get_prompt_version,
+    store_cached_answer,
+)
+from .custom_component import (
+    AIChunkCompressing,
+    CachedTextEmbedder,
+    DocumentLimiter,
+    LocalChunkRelevanceFilter,
+    RateLimitedGenerator,
+    chunk_relevance_mode,
+)
+from .custom_retriever import ElasticsearchHybridRetriever
+from .custom_formatter import ANSWER_JSON_SCHEMA, StructuredAnswerFormatter
 import json
 
 load_dotenv()  # Load the .env file
@@ -42,6 +58,22 @@ azure_4omini_key = os.environ.get("AZURE_4OMINI_KEY")
 fireworks_api_url = "https://api.fireworks.ai/inference/v1"
 drive_folder_id_external = os.environ.get("DRIVE_FOLDER_ID_EXTERNAL")
 drive_folder_id_internal = os.environ.get("DRIVE_FOLDER_ID_INTERNAL")
+# Prompts of one institute answered at the same time; LLM calls are further capped process-wide
+prompt_concurrency = int(os.environ.get("PROMPT_CONCURRENCY", 4))
+# Answer prompts with overlapping chunks together in one LLM call
+batched_answer_mode = os.environ.get("BATCHED_ANSWERS", "false").lower() == "true"
+batched_answer_max_prompts = int(os.environ.get("BATCHED_ANSWER_MAX_PROMPTS", 5))
+# Share of a prompt's chunks that must already be in a group's context for it to join the group
+batched_answer_min_overlap = float(os.environ.get("BATCHED_ANSWER_MIN_OVERLAP", 0.5))
+batched_answer_token_budget = int(os.environ.get("BATCHED_ANSWER_TOKEN_BUDGET", 12000))
+# Answer in the prompt's format with one structured call, formatting locally instead of with a second LLM
+single_call_answer_mode = os.environ.get("SINGLE_CALL_ANSWERS", "false").lower() == "true"
+# json_schema response formats need a newer Azure OpenAI API version than the generators' default
+azure_structured_output_api_version = os.environ.get(
+    "AZURE_STRUCTURED_OUTPUT_API_VERSION", "2024-08-01-preview"
+)
+# Reuse a prompt's stored answer when retrieval returns the same chunks as when it was generated
+answer_cache_mode = os.environ.get("ANSWER_CACHE", "false").lower() == "true"
 
 try:
     log_file_path = os.path.join(log_files_folder, "query_multiple.log")
@@ -55,64 +87,46 @@ except Exception as e:
     print(f"Failed to set up logging: {e}")
 
 
-def query_pipeline_answer_builder(
-    q,
-    inst_id,
-    answer_data_type,
-    document_store,
-    search_terms=None,
-    num_chunks=None,
-    model="4o-mini",
-    sys_prompt=None,
-    grammar=False,
-    response_type="text",
-):
-    """
-    Constructs and runs a query pipeline with hybrid retrieval methods, generating an answer using OpenAI's model.
+_idle_query_pipelines = {}
+_idle_query_pipelines_lock = threading.Lock()
+_batched_answer_generators = {}
+_batched_answer_generators_lock = threading.Lock()
 
-    Parameters:
-    - q (str): The text query to be processed.
-    - answer_data_tpye (str): The type of data to be extracted from the documents.
-    - inst_id (str): Institution identifier to filter documents in the retrieval.
-    - document_store (ElasticsearchDocumentStore): The Elasticsearch store to retrieve and store documents.
-    - model (str): The model to be used for answer generation. Values are 3.5t mixtral7b mixtral22b llama. defaults to 3.5t
-    Returns:
-    - dict: A dictionary containing the results from running the pipeline on the query.
+model_base_urls = {
+    "3.5t": None,
+    "4t": None,
+    "mixtral7b": "https://api.fireworks.ai/inference/v1",
+    "mixtral22b": "https://api.fireworks.ai/inference/v1",
+    "llama": "https://api.fireworks.ai/inference/v1",
+    "4o-mini": azure_4omini_endpoint,
+}
 
-    This function sets up a pipeline with text embedding and retrieval components, followed by document joining,
-    prompt building, and answer generation using OpenAI's language model.
+# retrieval: embedder to limiter, answer: prompt_builder and llm, formatter: answer formatter and answer_builder
+RETRIEVAL_STAGE = "retrieval"
+ANSWER_STAGE = "answer"
+FORMATTER_STAGE = "formatter"
+QUERY_PIPELINE_STAGES = (RETRIEVAL_STAGE, ANSWER_STAGE, FORMATTER_STAGE)
+
+
+def build_query_pipeline(chunk_index, model="4o-mini", sys_prompt=None, stages=QUERY_PIPELINE_STAGES):
     """
-    if not search_terms:
-        search_terms = q
+    Builds the hybrid retrieval and answer generation pipeline for a chunk index.
 
-    models = {
-        "3.5t": "gpt-3.5-turbo-0125",
-        "mixtral7b": "accounts/fireworks/models/mixtral-8x7b-instruct",
-        "mixtral22b": "accounts/fireworks/models/mixtral-8x22b-instruct",
-        "llama": "accounts/fireworks/models/llama-v3-70b-instruct",
-        "4t": "gpt-4-turbo",
-        "4o-mini": "gpt-4o-mini",
-    }
-    model_key = models.get(model, None)
-    model_to_chunk_size = {"default": 7, "llama": 7, "mixtral22b": 10, "4t": 20}
-    if not num_chunks:
-        chunk_size = model_to_chunk_size.get(model, model_to_chunk_size["default"])
-    else:
-        chunk_size = num_chunks
+    Nothing in the pipeline depends on the prompt or the institute: the query, the retrieval filters, the number
+    of chunks kept and the generation kwargs are passed to `Pipeline.run`, so one pipeline answers every prompt.
 
-    if model in ["3.5t", "4t"]:
-        api_key = open_ai_key
-    else:
-        api_key = fireworks_api_key
-    base_urls = {
-        "3.5t": None,
-        "4t": None,
-        "mixtral7b": "https://api.fireworks.ai/inference/v1",
-        "mixtral22b": "https://api.fireworks.ai/inference/v1",
-        "llama": "https://api.fireworks.ai/inference/v1",
-        "4o-mini": azure_4omini_endpoint,
-    }
-    base_url = base_urls.get(model, None)
+    Parameters:
+    - chunk_index (str): The chunk index to retrieve from.
+    - model (str): The model key of the answer generation, which selects the endpoint.
+    - sys_prompt (str): System prompt of the answer LLM. Defaults to the college data fetcher prompt.
+    - stages (tuple): The stages to build. Without retrieval, prompt_builder and answer_builder take the
+      documents as run input; without the answer stage, the formatter takes the results.
+    With SINGLE_CALL_ANSWERS the answer LLM is given the Format and answers with ANSWER_JSON_SCHEMA, and
+    StructuredAnswerFormatter takes the formatter LLM's place, calling it only for replies it can't format.
+    Returns:
+    - Pipeline: The connected pipeline.
+    """
+    base_url = model_base_urls.get(model, None)
     prompt_template = """
     You are given a user's query in the Question field. Respond appropriately to the user's input using only the documents in the Documents field. If you can not find the answer, return "I do not have that information."
     \nDocuments:
@@ -124,6 +138,19 @@ def query_pipeline_answer_builder(
     \nQuestion: {{query}}
     \nAnswer:
     """
+    single_call_prompt_template = """
+    You are given a user's query in the Question field. Respond appropriately to the user's input using only the documents in the Documents field. If you can not find the answer, return "I do not have that information."
+    Write the answer in the format given in the Format field: a list as one item per line, a table as an HTML table, JSON as a JSON string.
+    \nDocuments:
+    {% for doc in documents %}
+        {{ doc.content }}
+    Source: {{ doc.id }}
+    {% endfor %}
+
+    \nQuestion: {{query}}
+    \nFormat: {{answer_data_type}} format
+    \nAnswer:
+    """
     if not sys_prompt:
         system = f"""You are a professional data fetcher to fetch college details. Give answer and the source ids from which you concluded the answer.
         DO NOT INCLUDE ANYTHING EXCEPT THE ANSWER REQUESTED.
@@ -136,18 +163,9 @@ def query_pipeline_answer_builder(
         """
     else:
         system = sys_prompt
-    query_pipeline = Pipeline()
-    query_pipeline.add_component(
-        "text_embedder",
-        OpenAITextEmbedder(
-            Secret.from_token(f"{open_ai_key}"),
-            model="text-embedding-3-large",
-        ),
-    )
-
-    system_prompt_answer_formatter = f"""
+    # The Format line is part of the formatter prompt, which is rendered per prompt
+    system_prompt_answer_formatter = """
     You are a highly professional formatter, who formats a given json object fields value into the format shown in the Format field returning only that.
-    \nFormat: {answer_data_type} format.
     """
     prompt_template_answer_formatter = """
     You are the second stage in a two-LLM pipeline. Your task is to reformat the answer provided by the first LLM according to a specified format. You will receive the original query and the output from the first LLM.
@@ -172,39 +190,236 @@ def query_pipeline_answer_builder(
     
     Note: If the input Result is an empty string or doesn't contain an answer, return an empty string for the "answer" field and an empty array for the "sources" field.    """
 
-    # filters = {"field": "meta.institute_id", "operator": "==", "value": f"{inst_id}"}
-    filters = {
-        "operator": "AND",
-        "conditions": [
-            {"field": "meta.institute_id", "operator": "==", "value": f"{inst_id}"},
-            {"field": "meta.status", "operator": "==", "value": True},
-        ],
+    query_pipeline = Pipeline()
+
+    if RETRIEVAL_STAGE in stages:
+        query_pipeline.add_component(
+            "text_embedder",
+            CachedTextEmbedder(
+                OpenAITextEmbedder(
+                    Secret.from_token(f"{open_ai_key}"),
+                    **get_embedder_params(chunk_index),
+                )
+            ),
+        )
+        query_pipeline.add_component(
+            "hybrid_retriever",
+            ElasticsearchHybridRetriever(
+                client=Elasticsearch(es_host, basic_auth=(es_user, es_password)),
+                index=chunk_index,
+                top_k=20,
+            ),
+        )
+
+        if chunk_relevance_mode == "LOCAL":
+            query_pipeline.add_component(instance=LocalChunkRelevanceFilter(name="Embedding Retriever"), name="embedding_chunk_compressing")
+            query_pipeline.add_component(instance=LocalChunkRelevanceFilter(name="BM25 Retriever"), name="bm25_chunk_compressing")
+            query_pipeline.connect("text_embedder.embedding", "embedding_chunk_compressing.query_embedding")
+            query_pipeline.connect("text_embedder.embedding", "bm25_chunk_compressing.query_embedding")
+        else:
+            query_pipeline.add_component(instance=AIChunkCompressing(name="Embedding Retriever"), name="embedding_chunk_compressing")
+            query_pipeline.add_component(instance=AIChunkCompressing(name="BM25 Retriever"), name="bm25_chunk_compressing")
+
+        query_pipeline.add_component(
+            "joiner",
+            DocumentJoiner(join_mode="reciprocal_rank_fusion", weights=[0.2, 0.8]),
+        )
+        query_pipeline.add_component("limiter", DocumentLimiter())
+
+        query_pipeline.connect("text_embedder.embedding", "hybrid_retriever.query_embedding")
+        query_pipeline.connect("hybrid_retriever.embedding_documents", "embedding_chunk_compressing.chunks")
+        query_pipeline.connect("hybrid_retriever.bm25_documents", "bm25_chunk_compressing.chunks")
+        query_pipeline.connect("embedding_chunk_compressing", "joiner")
+        query_pipeline.connect("bm25_chunk_compressing", "joiner")
+        query_pipeline.connect("joiner", "limiter")
+
+    if ANSWER_STAGE in stages:
+        if single_call_answer_mode:
+            query_pipeline.add_component(
+                instance=PromptBuilder(template=single_call_prompt_template), name="prompt_builder"
+            )
+            query_pipeline.add_component(
+                instance=RateLimitedGenerator(
+                    AzureOpenAIGenerator(
+                        api_key=Secret.from_token(f"{azure_4omini_key}"),
+                        system_prompt=system,
+                        azure_deployment="gpt-4o-mini",
+                        azure_endpoint=base_url,
+                        api_version=azure_structured_output_api_version,
+                        generation_kwargs={"temperature": 0, "response_format": ANSWER_JSON_SCHEMA},
+                    )
+                ),
+                name="llm",
+            )
+        else:
+            query_pipeline.add_component(
+                instance=PromptBuilder(template=prompt_template), name="prompt_builder"
+            )
+            query_pipeline.add_component(
+                instance=RateLimitedGenerator(
+                    AzureOpenAIGenerator(
+                        api_key=Secret.from_token(f"{azure_4omini_key}"),
+                        system_prompt=system,
+                        azure_deployment="gpt-4o-mini",
+                        azure_endpoint=base_url,
+                        generation_kwargs={"temperature": 0},
+                    )
+                ),
+                name="llm",
+            )
+        query_pipeline.connect("prompt_builder", "llm")
+
+    if FORMATTER_STAGE in stages:
+        llm_answer_formatter = RateLimitedGenerator(
+            AzureOpenAIGenerator(
+                api_key=Secret.from_token(f"{azure_4omini_key}"),
+                system_prompt=system_prompt_answer_formatter,
+                azure_deployment="gpt-4o-mini",
+                azure_endpoint=base_url,
+                generation_kwargs = {
+                    "temperature": 0,
+                    "response_format": {"type": "json_object"}
+                },
+            )
+        )
+        query_pipeline.add_component(instance=AnswerBuilder(), name="answer_builder")
+
+        if single_call_answer_mode:
+            query_pipeline.add_component(
+                instance=StructuredAnswerFormatter(
+                    fallback_template=prompt_template_answer_formatter,
+                    fallback_generator=llm_answer_formatter,
+                ),
+                name="answer_formatter",
+            )
+            query_pipeline.connect("answer_formatter.meta", "answer_builder.meta")
+            query_pipeline.connect("answer_formatter.replies", "answer_builder.replies")
+        else:
+            query_pipeline.add_component(instance=llm_answer_formatter, name="llm_answer_formatter")
+            query_pipeline.add_component(
+                instance=PromptBuilder(template=prompt_template_answer_formatter),
+                name="prompt_builder_answer_formatter",
+            )
+
+            query_pipeline.connect("llm_answer_formatter.meta", "answer_builder.meta")
+            query_pipeline.connect("prompt_builder_answer_formatter", "llm_answer_formatter")
+            query_pipeline.connect("llm_answer_formatter.replies", "answer_builder.replies")
+
+    # A stage left out takes what it would have received as run input
+    if RETRIEVAL_STAGE in stages and ANSWER_STAGE in stages:
+        query_pipeline.connect("limiter", "prompt_builder.documents")
+    if RETRIEVAL_STAGE in stages and FORMATTER_STAGE in stages:
+        query_pipeline.connect("limiter", "answer_builder.documents")
+    if ANSWER_STAGE in stages and FORMATTER_STAGE in stages:
+        if single_call_answer_mode:
+            query_pipeline.connect("llm.replies", "answer_formatter.replies")
+            query_pipeline.connect("llm.meta", "answer_formatter.meta")
+        else:
+            query_pipeline.connect("llm.replies", "prompt_builder_answer_formatter.results")
+
+    return query_pipeline
+
+
+@contextmanager
+def checkout_query_pipeline(chunk_index, model="4o-mini", sys_prompt=None, stages=QUERY_PIPELINE_STAGES):
+    """
+    Lends out a prebuilt query pipeline for the chunk index, model and stages, returning it to the pool after use.
+
+    Pipelines keep per-run bookkeeping on their graph, so each run gets one no other run is using. The pool is
+    shared by all threads, so prompt workers started for every institute run reuse the pipelines of earlier runs
+    and only build one when all are in use. Custom system prompts are one-off requests and get a fresh pipeline.
+    """
+    if sys_prompt:
+        yield build_query_pipeline(chunk_index, model, sys_prompt, stages)
+        return
+
+    key = (chunk_index, model, tuple(stages))
+    with _idle_query_pipelines_lock:
+        idle = _idle_query_pipelines.setdefault(key, [])
+        query_pipeline = idle.pop() if idle else None
+    if query_pipeline is None:
+        query_pipeline = build_query_pipeline(chunk_index, model, stages=stages)
+    try:
+        yield query_pipeline
+    finally:
+        with _idle_query_pipelines_lock:
+            _idle_query_pipelines[key].append(query_pipeline)
+
+
+def get_retrieval_filters(inst_id, chunk_index):
+    # Elasticsearch filter clauses for ElasticsearchHybridRetriever; term filters on keyword fields are cached
+    generation = get_active_chunk_generation(inst_id, chunk_index)
+    if generation is None:
+        # Institutes embedded before chunk generations
+        active_chunks = {"term": {"status": True}}
+    else:
+        active_chunks = {"term": {"generation": generation}}
+    return [{"term": {"institute_id": f"{inst_id}"}}, active_chunks]
+
+
+def get_chunk_size(model, num_chunks=None):
+    model_to_chunk_size = {"default": 7, "llama": 7, "mixtral22b": 10, "4t": 20}
+    if not num_chunks:
+        return model_to_chunk_size.get(model, model_to_chunk_size["default"])
+    return num_chunks
+
+
+def get_retrieval_inputs(q, inst_id, chunk_index, search_terms, chunk_size, filters=None):
+    # Run inputs of the retrieval stage; runs over many prompts resolve the filters once and pass them in
+    if filters is None:
+        filters = get_retrieval_filters(inst_id, chunk_index)
+    return {
+        "text_embedder": {"text": search_terms},
+        "hybrid_retriever": {"query": search_terms, "filters": filters},
+        "embedding_chunk_compressing": {"query": q},
+        "bm25_chunk_compressing": {"query": q},
+        "limiter": {"top_k": chunk_size},
     }
-    query_pipeline.add_component(
-        "retriever",
-        ElasticsearchEmbeddingRetriever(
-            document_store=document_store, top_k=20, filters=filters
-        ),
-    )
-    query_pipeline.add_component(
-        "bm25_retriever",
-        ElasticsearchBM25Retriever(
-            document_store=document_store, top_k=20, filters=filters
-        ),
-    )
 
-    query_pipeline.add_component(instance=AIChunkCompressing(name="Embedding Retriever", query=q, inst_id=inst_id), name="embedding_chunk_compressing")
-    query_pipeline.add_component(instance=AIChunkCompressing(name="BM25 Retriever", query=q, inst_id=inst_id), name="bm25_chunk_compressing")
 
-    query_pipeline.add_component(
-        "joiner",
-        DocumentJoiner(
-            join_mode="reciprocal_rank_fusion", top_k=chunk_size, weights=[0.2, 0.8]
-        ),
-    )
-    query_pipeline.add_component(
-        instance=PromptBuilder(template=prompt_template), name="prompt_builder"
-    )
+def get_formatter_inputs(q, answer_data_type):
+    # Run inputs of the formatter stage, which in single-call mode is StructuredAnswerFormatter
+    formatter = "answer_formatter" if single_call_answer_mode else "prompt_builder_answer_formatter"
+    return {
+        formatter: {"answer_data_type": answer_data_type, "query": q},
+        "answer_builder": {"query": q},
+    }
+
+
+def query_pipeline_answer_builder(
+    q,
+    inst_id,
+    answer_data_type,
+    document_store,
+    search_terms=None,
+    num_chunks=None,
+    model="4o-mini",
+    sys_prompt=None,
+    grammar=False,
+    response_type="text",
+    documents=None,
+    filters=None,
+):
+    """
+    Runs the hybrid retrieval query pipeline for one prompt, generating an answer using OpenAI's model.
+
+    Parameters:
+    - q (str): The text query to be processed.
+    - answer_data_tpye (str): The type of data to be extracted from the documents.
+    - inst_id (str): Institution identifier to filter documents in the retrieval.
+    - document_store (ElasticsearchDocumentStore): The Elasticsearch store to retrieve and store documents.
+    - model (str): The model to be used for answer generation. Values are 3.5t mixtral7b mixtral22b llama. defaults to 3.5t
+    - documents (list): Chunks already retrieved by retrieve_prompt_documents, which skips the retrieval stage.
+    - filters (list): The institute's retrieval filters from get_retrieval_filters, looked up if not given.
+    Returns:
+    - dict: A dictionary containing the results from running the pipeline on the query.
+
+    The pipeline for the store's index and the model is built once and lent out by checkout_query_pipeline;
+    this function only prepares the per-prompt inputs.
+    """
+    if not search_terms:
+        search_terms = q
+
     if grammar:
         grammar = """
         root ::= city
@@ -215,71 +430,75 @@ def query_pipeline_answer_builder(
         }
     else:
         generation_kwargs = {"temperature": 0}
-    query_pipeline.add_component(
-        instance=AzureOpenAIGenerator(
-            api_key=Secret.from_token(f"{azure_4omini_key}"),
-            system_prompt=system,
-            azure_deployment="gpt-4o-mini",
-            azure_endpoint=base_url,
-            generation_kwargs=generation_kwargs,
-        ),
-        name="llm",
-    )
-
-    query_pipeline.add_component(
-        instance=AzureOpenAIGenerator(
-            api_key=Secret.from_token(f"{azure_4omini_key}"),
-            system_prompt=system_prompt_answer_formatter,
-            azure_deployment="gpt-4o-mini",
-            azure_endpoint=base_url,
-            generation_kwargs = {
-                "temperature": 0,
-                "response_format": {"type": "json_object"}
-            },
-        ),
-        name="llm_answer_formatter",
-    )
-
-    query_pipeline.add_component(
-        instance=PromptBuilder(template=prompt_template_answer_formatter),
-        name="prompt_builder_answer_formatter",
-    )
-    query_pipeline.add_component(instance=AnswerBuilder(), name="answer_builder")
-
-    query_pipeline.connect("text_embedder.embedding", "retriever.query_embedding")
-    query_pipeline.connect("retriever", "embedding_chunk_compressing")
-    query_pipeline.connect("bm25_retriever", "bm25_chunk_compressing")
-    query_pipeline.connect("embedding_chunk_compressing", "joiner")
-    query_pipeline.connect("bm25_chunk_compressing", "joiner")
-    query_pipeline.connect("joiner", "prompt_builder.documents")
-    query_pipeline.connect("prompt_builder", "llm")
-    query_pipeline.connect("llm_answer_formatter.meta", "answer_builder.meta")
-    query_pipeline.connect("joiner", "answer_builder.documents")
-    query_pipeline.connect("llm.replies", "prompt_builder_answer_formatter.results")
-    query_pipeline.connect("prompt_builder_answer_formatter", "llm_answer_formatter")
-    query_pipeline.connect("llm_answer_formatter.replies", "answer_builder.replies")
 
+    chunk_index = document_store.to_dict()["init_parameters"]["index"]
+    inputs = {
+        "prompt_builder": {"query": q},
+        "llm": {"generation_kwargs": generation_kwargs},
+        **get_formatter_inputs(q, answer_data_type),
+    }
+    if single_call_answer_mode:
+        inputs["prompt_builder"]["answer_data_type"] = answer_data_type
+    if documents is None:
+        stages = QUERY_PIPELINE_STAGES
+        inputs.update(
+            get_retrieval_inputs(
+                q, inst_id, chunk_index, search_terms, get_chunk_size(model, num_chunks), filters
+            )
+        )
+    else:
+        stages = (ANSWER_STAGE, FORMATTER_STAGE)
+        inputs["prompt_builder"]["documents"] = documents
+        inputs["answer_builder"]["documents"] = documents
     logging.info(
         f"Starting query pipeline for query: '{q}' and institution ID: '{inst_id}'"
     )
 
-    result = query_pipeline.run(
-        {
-            "text_embedder": {"text": search_terms},
-            "bm25_retriever": {"query": search_terms},
-            "prompt_builder": {"query": q},
-            "prompt_builder_answer_formatter": {
-                "answer_data_type": answer_data_type,
-                "query": q,
-            },
-            "answer_builder": {"query": q},
-        }
-    )
+    with checkout_query_pipeline(chunk_index, model, sys_prompt, stages) as query_pipeline:
+        result = query_pipeline.run(inputs)
     logging.info(f"Query pipeline execution completed for query: '{q}'")
 
     return result
 
 
+def retrieve_prompt_documents(
+    q, inst_id, document_store, search_terms=None, num_chunks=None, model="4o-mini", filters=None
+):
+    """
+    Runs only the retrieval stage of the query pipeline for one prompt.
+
+    Returns:
+    - list: The chunks the answer would be generated from.
+    """
+    chunk_index = document_store.to_dict()["init_parameters"]["index"]
+    with checkout_query_pipeline(chunk_index, model, stages=(RETRIEVAL_STAGE,)) as query_pipeline:
+        result = query_pipeline.run(
+            get_retrieval_inputs(
+                q, inst_id, chunk_index, search_terms or q, get_chunk_size(model, num_chunks), filters
+            )
+        )
+    return result["limiter"]["documents"]
+
+
+def format_prompt_answer(q, answer_data_type, documents, reply, model="4o-mini"):
+    """
+    Runs only the formatter stage, on an answer generated outside the query pipeline.
+
+    Parameters:
+    - reply (str): The answer as the answer LLM gives it, a JSON object with answer and sources.
+    Returns:
+    - dict: The pipeline result, shaped like query_pipeline_answer_builder's.
+    """
+    inputs = get_formatter_inputs(q, answer_data_type)
+    if single_call_answer_mode:
+        inputs["answer_formatter"]["replies"] = [reply]
+    else:
+        inputs["prompt_builder_answer_formatter"]["results"] = [reply]
+    inputs["answer_builder"]["documents"] = documents
+    with checkout_query_pipeline(None, model, stages=(FORMATTER_STAGE,)) as query_pipeline:
+        return query_pipeline.run(inputs)
+
+
 def get_gspread_client():
     scope = [
         "https://spreadsheets.google.com/feeds",
@@ -480,23 +699,6 @@ def get_prompts_to_run(es, inst_id, prompts_obj_id_dict):
         logging.error(f"Failed to GET Prompts from Index, {e}")
 
 
-def add_prompts_institute_entry(es, inst_id, prompt_id):
-    try:
-        create_response = es.index(
-            index=prompts_institute_index,
-            body={
-                "institute_id": inst_id,
-                "prompt_id": prompt_id,
-                "run_status": True,
-                "status": True,
-            },
-        )
-        return create_response["_id"]
-
-    except Exception as e:
-        logging.error(f"Failed to ADD Prompts Institute from Index, {e}")
-
-
 def add_prompts_run_logs_entry(es, prompt_id, inst_id, result, data_type):
     """
     Adds a new entry to the prompts_run_logs index.
@@ -525,28 +727,485 @@ def add_prompts_run_logs_entry(es, prompt_id, inst_id, result, data_type):
         logging.error(f"Failed to ADD Prompts RUN LOGS from Index, {e}")
 
 
-def add_answer_in_ip_answer(es, ip_id, answer, data_type, original_links, tags, source_links):
+def run_prompts_concurrently(run_prompt, prompt_jobs):
+    """
+    Runs run_prompt for every job, up to PROMPT_CONCURRENCY at a time, and returns the results in job order.
+
+    Workers borrow query pipelines through checkout_query_pipeline, so the short-lived threads don't rebuild
+    them. run_prompt must handle its own errors.
+    """
+    if not prompt_jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(prompt_concurrency, len(prompt_jobs))) as executor:
+        return list(executor.map(run_prompt, prompt_jobs))
+
+
+def get_prompt_answer(answer_data, documents, prompt_id, data_type, tags, format_answer=None):
+    """
+    Collects what save_prompt_answers writes for one answered prompt.
+
+    Parameters:
+    - answer_data (str): The answer builder's answer, a JSON object with answer and sources.
+    - documents (list): The chunks the answer was generated from.
+    - format_answer (callable): Turns the generated answer into the stored one, if given.
+    """
+    answer_obj = json.loads(answer_data)
+    answer = answer_obj["answer"]
+    if format_answer:
+        answer = format_answer(answer)
+    sources = answer_obj["sources"]
+
+    original_links = []
+    source_links = []
+    for doc in documents:
+        if str(doc.id) in sources:
+            source_links.append(doc.meta["file_url"])
+        original_links.append(doc.meta["file_url"])
+
+    return {
+        "prompt_id": prompt_id,
+        "answer": answer,
+        "data_type": data_type,
+        "tags": tags,
+        "original_links": original_links,
+        "source_links": source_links,
+    }
+
+
+def get_answer_cache_key(job, documents, model):
+    # Answers of the single-call pipeline are formatted differently, so they are cached apart
+    cache_model = f"{model}/single-call" if single_call_answer_mode else model
+    return get_cache_key(
+        job["prompt_id"], get_prompt_version(job), cache_model, get_context_fingerprint(documents)
+    )
+
+
+def get_cached_prompt_answer(job, documents, model):
+    """
+    Returns the get_prompt_answer entry of the job from the answer cache, marked cached, or None on a miss.
+    """
+    answer_data = get_cached_answer(get_answer_cache_key(job, documents, model), documents)
+    if answer_data is None:
+        return None
     try:
-        ip_answer_obj = es.index(
-            index="ip_answer",
-            body={
+        prompt_answer = get_prompt_answer(
+            answer_data, documents, job["prompt_id"], job["data_type"], job["tags"], job.get("format_answer")
+        )
+    except Exception as e:
+        logging.error(f"Cached answer of prompt {job['prompt_id']} is unusable, answering it again: {e}")
+        return None
+    prompt_answer["cached"] = True
+    return prompt_answer
+
+
+def cache_prompt_answer(job, documents, model, answer_data):
+    store_cached_answer(
+        get_answer_cache_key(job, documents, model),
+        job["prompt_id"],
+        get_prompt_version(job),
+        model,
+        documents,
+        answer_data,
+    )
+
+
+def answer_prompt_job(job, inst_id, document_store, model, documents=None, filters=None):
+    """
+    Answers one prompt job through the query pipeline and returns its get_prompt_answer entry, or None on failure.
+
+    A job holds prompt_id, prompt, data_type, tags, search_terms, num_chunks and response_type from the prompt,
+    and optionally format_answer. With ANSWER_CACHE, retrieval runs first and the answer cache is checked for
+    the retrieved chunks before the answer LLM is called; given documents are assumed already checked.
+    """
+    try:
+        if answer_cache_mode and documents is None:
+            documents = retrieve_prompt_documents(
+                job["prompt"],
+                inst_id,
+                document_store,
+                search_terms=job["search_terms"],
+                num_chunks=job["num_chunks"],
+                model=model,
+                filters=filters,
+            )
+            prompt_answer = get_cached_prompt_answer(job, documents, model)
+            if prompt_answer:
+                return prompt_answer
+
+        result = query_pipeline_answer_builder(
+            job["prompt"],
+            inst_id,
+            job["data_type"],
+            document_store,
+            search_terms=job["search_terms"],
+            num_chunks=job["num_chunks"],
+            model=model,
+            response_type=job["response_type"],
+            documents=documents,
+            filters=filters,
+        )
+        answer = result["answer_builder"]["answers"][0]
+        if answer_cache_mode:
+            cache_prompt_answer(job, answer.documents, model, answer.data)
+        return get_prompt_answer(
+            answer.data, answer.documents, job["prompt_id"], job["data_type"], job["tags"], job.get("format_answer")
+        )
+    except Exception as e:
+        logging.error(f"Error while running the prompt: {job['prompt']} - {e}")
+        return None
+
+
+def answer_prompt_jobs(prompt_jobs, inst_id, document_store, model):
+    """
+    Answers an institute's prompt jobs, concurrently and, with BATCHED_ANSWERS, in batches.
+
+    The institute's active chunk generation is looked up once for all its prompts.
+
+    Returns:
+    - list: The get_prompt_answer entries in job order, None for failed prompts.
+    """
+    filters = get_retrieval_filters(inst_id, document_store.to_dict()["init_parameters"]["index"])
+    if batched_answer_mode and len(prompt_jobs) > 1:
+        prompt_answers = answer_prompt_jobs_batched(prompt_jobs, inst_id, document_store, model, filters)
+    else:
+        prompt_answers = run_prompts_concurrently(
+            lambda job: answer_prompt_job(job, inst_id, document_store, model, filters=filters), prompt_jobs
+        )
+    if answer_cache_mode and prompt_jobs:
+        cache_hits = sum(1 for entry in prompt_answers if entry and entry.get("cached"))
+        logging.info(
+            f"Answer cache for institution ID '{inst_id}': {cache_hits} of {len(prompt_jobs)} prompts reused "
+            f"({cache_hits / len(prompt_jobs):.0%} hit rate), "
+            f"{sum(1 for entry in prompt_answers if entry and not entry.get('cached'))} answered by the LLM"
+        )
+    return prompt_answers
+
+
+def estimate_tokens(text):
+    return len(text or "") // 4
+
+
+def group_prompts_by_context(prompt_documents):
+    """
+    Groups prompts whose retrieved chunks overlap, so each group is answered from one shared context.
+
+    A prompt joins the first group that has room, already holds at least BATCHED_ANSWER_MIN_OVERLAP of its
+    chunks, and stays within BATCHED_ANSWER_TOKEN_BUDGET with the prompt's other chunks added. Otherwise it
+    starts a group of its own. A group of one is answered by a single call.
+
+    Parameters:
+    - prompt_documents (list): (job index, retrieved chunks) pairs.
+    Returns:
+    - list: The job indices of every group.
+    """
+    groups = []
+    for i, documents in prompt_documents:
+        ids = {doc.id for doc in documents}
+        for group in groups:
+            if len(group["prompts"]) >= batched_answer_max_prompts:
+                continue
+            if not ids or len(ids & group["ids"]) / len(ids) < batched_answer_min_overlap:
+                continue
+            tokens = group["tokens"] + sum(
+                estimate_tokens(doc.content) for doc in documents if doc.id not in group["ids"]
+            )
+            if tokens > batched_answer_token_budget:
+                continue
+            group["prompts"].append(i)
+            group["ids"] |= ids
+            group["tokens"] = tokens
+            break
+        else:
+            groups.append(
+                {
+                    "prompts": [i],
+                    "ids": set(ids),
+                    "tokens": sum(estimate_tokens(doc.content) for doc in documents),
+                }
+            )
+    return [group["prompts"] for group in groups]
+
+
+def get_batched_answer_generator(model):
+    with _batched_answer_generators_lock:
+        if model not in _batched_answer_generators:
+            _batched_answer_generators[model] = RateLimitedGenerator(
+                AzureOpenAIGenerator(
+                    api_key=Secret.from_token(f"{azure_4omini_key}"),
+                    system_prompt="""You are a professional data fetcher to fetch college details. For every question give the answer and the source ids from which you concluded the answer.
+        DO NOT INCLUDE ANYTHING EXCEPT THE ANSWERS REQUESTED. Respond only with JSON.""",
+                    azure_deployment="gpt-4o-mini",
+                    azure_endpoint=model_base_urls.get(model, None),
+                    generation_kwargs={
+                        "temperature": 0,
+                        "response_format": {"type": "json_object"},
+                    },
+                )
+            )
+        return _batched_answer_generators[model]
+
+
+def generate_batched_answers(prompt_jobs, prompt_documents, model):
+    """
+    Answers several prompts with one LLM call over the union of their chunks.
+
+    Returns:
+    - dict: For every prompt id answered, the reply as the answer LLM of the query pipeline gives it, a JSON
+      object with answer and sources.
+    """
+    documents = {}
+    for prompt_docs in prompt_documents:
+        for doc in prompt_docs:
+            documents.setdefault(doc.id, doc)
+
+    prompt_template = """
+    You are given several user queries in the Questions field, each with an id. Answer every question using only the documents in the Documents field. If you can not find the answer to a question, answer "I do not have that information."
+    \nDocuments:
+    {% for doc in documents %}
+        {{ doc.content }}
+    Source: {{ doc.id }}
+    {% endfor %}
+
+    \nQuestions:
+    {% for question in questions %}
+    [{{ question.id }}] {{ question.query }} (Format: {{ question.format }})
+    {% endfor %}
+
+    \nGive the answers as a JSON object with one field per question id:
+    {
+      "<question id>": {"answer": "<answer>", "sources": ["<source id>", "<source id>"]}
+    }
+    """
+    prompt = PromptBuilder(template=prompt_template).run(
+        documents=list(documents.values()),
+        questions=[
+            {"id": job["prompt_id"], "query": job["prompt"], "format": job["data_type"]}
+            for job in prompt_jobs
+        ],
+    )["prompt"]
+    reply = get_batched_answer_generator(model).run(prompt=prompt)["replies"][0]
+
+    answers = json.loads(reply)
+    replies = {}
+    for job in prompt_jobs:
+        answer = answers.get(job["prompt_id"])
+        if isinstance(answer, dict) and "answer" in answer:
+            replies[job["prompt_id"]] = json.dumps(
+                {"answer": answer["answer"], "sources": answer.get("sources", [])}
+            )
+    return replies
+
+
+def answer_prompt_jobs_batched(prompt_jobs, inst_id, document_store, model, filters=None):
+    """
+    Answers prompt jobs in groups of prompts retrieving overlapping chunks, one answer LLM call per group.
+
+    Retrieval runs per prompt as usual, and with ANSWER_CACHE prompts whose chunks have a cached answer are left
+    out of the groups. Each group's answers go through the formatter stage one by one, with the
+    prompt's own chunks as its documents. Prompts left unanswered by their group's call, and groups of one, get
+    the single-prompt answer call on their already retrieved chunks.
+    """
+
+    def retrieve(job):
+        try:
+            return retrieve_prompt_documents(
+                job["prompt"],
+                inst_id,
+                document_store,
+                search_terms=job["search_terms"],
+                num_chunks=job["num_chunks"],
+                model=model,
+                filters=filters,
+            )
+        except Exception as e:
+            logging.error(f"Error while running the prompt: {job['prompt']} - {e}")
+            return None
+
+    documents = run_prompts_concurrently(retrieve, prompt_jobs)
+    prompt_answers = [None] * len(prompt_jobs)
+    if answer_cache_mode:
+
+        def get_cached(i):
+            if documents[i] is None:
+                return None
+            return get_cached_prompt_answer(prompt_jobs[i], documents[i], model)
+
+        prompt_answers = run_prompts_concurrently(get_cached, list(range(len(prompt_jobs))))
+    groups = group_prompts_by_context(
+        [
+            (i, docs)
+            for i, docs in enumerate(documents)
+            if docs is not None and prompt_answers[i] is None
+        ]
+    )
+
+    def answer_group(group):
+        replies = {}
+        if len(group) > 1:
+            try:
+                replies = generate_batched_answers(
+                    [prompt_jobs[i] for i in group], [documents[i] for i in group], model
+                )
+            except Exception as e:
+                logging.error(f"Batched answer of {len(group)} prompts failed, answering them one by one: {e}")
+
+        group_answers = []
+        for i in group:
+            job = prompt_jobs[i]
+            if job["prompt_id"] not in replies:
+                group_answers.append(
+                    (i, answer_prompt_job(job, inst_id, document_store, model, documents[i], filters))
+                )
+                continue
+            try:
+                result = format_prompt_answer(
+                    job["prompt"], job["data_type"], documents[i], replies[job["prompt_id"]], model
+                )
+                answer = result["answer_builder"]["answers"][0]
+                if answer_cache_mode:
+                    cache_prompt_answer(job, documents[i], model, answer.data)
+                group_answers.append(
+                    (
+                        i,
+                        get_prompt_answer(
+                            answer.data,
+                            answer.documents,
+                            job["prompt_id"],
+                            job["data_type"],
+                            job["tags"],
+                            job.get("format_answer"),
+                        ),
+                    )
+                )
+            except Exception as e:
+                logging.error(f"Error while running the prompt: {job['prompt']} - {e}")
+                group_answers.append((i, None))
+        return group_answers
+
+    for group_answers in run_prompts_concurrently(answer_group, groups):
+        for i, answer in group_answers:
+            prompt_answers[i] = answer
+    logging.info(
+        f"Answered {len(prompt_jobs)} prompts of institution ID '{inst_id}' with "
+        f"{sum(len(group) > 1 for group in groups)} batched calls for "
+        f"{sum(len(group) for group in groups if len(group) > 1)} prompts"
+    )
+    return prompt_answers
+
+
+def add_prompts_institute_entries(es, inst_id, prompt_ids, update_existing=False):
+    """
+    Adds the institute's prompts_institute entries with one bulk request, returning their IDs in prompt order.
+
+    With update_existing, entries already stored for the institute and prompt are marked run again instead of
+    duplicated. Entries that fail to write get None.
+    """
+    existing = {}
+    if update_existing:
+        try:
+            response = es.search(
+                index=prompts_institute_index,
+                query={
+                    "bool": {
+                        "must": [
+                            {"terms": {"prompt_id": prompt_ids}},
+                            {"term": {"institute_id": inst_id}},
+                        ]
+                    }
+                },
+                size=10000,
+            )
+            for hit in response["hits"]["hits"]:
+                existing.setdefault(hit["_source"]["prompt_id"], hit["_id"])
+        except Exception as e:
+            logging.error(f"Failed to GET Prompts Institute Entries, {e}")
+
+    operations = []
+    for prompt_id in prompt_ids:
+        if prompt_id in existing:
+            operations.append({"update": {"_index": prompts_institute_index, "_id": existing[prompt_id]}})
+            operations.append({"doc": {"run_status": True, "status": True}})
+        else:
+            operations.append({"index": {"_index": prompts_institute_index}})
+            operations.append(
+                {
+                    "institute_id": inst_id,
+                    "prompt_id": prompt_id,
+                    "run_status": True,
+                    "status": True,
+                }
+            )
+
+    try:
+        response = es.bulk(operations=operations)
+    except Exception as e:
+        logging.error(f"Failed to ADD Prompts Institute Entries, {e}")
+        return [None] * len(prompt_ids)
+
+    ip_ids = []
+    for item in response["items"]:
+        result = next(iter(item.values()))
+        if "error" in result:
+            logging.error(f"Failed to ADD Prompts Institute Entry, {result['error']}")
+            ip_ids.append(None)
+        else:
+            ip_ids.append(result["_id"])
+    return ip_ids
+
+
+def save_prompt_answers(es, inst_id, prompt_answers, update_existing=False):
+    """
+    Writes the prompts_institute entries and ip_answer documents of an institute's run with one bulk request each.
+
+    Parameters:
+    - es (Elasticsearch): The Elasticsearch client.
+    - inst_id (str): The identifier for the institution.
+    - prompt_answers (list): Answers from get_prompt_answer, in prompt order.
+    - update_existing (bool): Reuse the institute's existing prompts_institute entries.
+    Returns:
+    - list: The ip_answer objects in prompt order, each with _id, answer and ip_id, None for answers that failed
+      to write.
+    """
+    if not prompt_answers:
+        return []
+    ip_ids = add_prompts_institute_entries(
+        es, inst_id, [entry["prompt_id"] for entry in prompt_answers], update_existing
+    )
+
+    operations = []
+    for entry, ip_id in zip(prompt_answers, ip_ids):
+        operations.append({"index": {"_index": "ip_answer"}})
+        operations.append(
+            {
                 "ip_id": ip_id,
-                "answer": answer,
-                "answer_data_type": data_type,
+                "answer": entry["answer"],
+                "answer_data_type": entry["data_type"],
                 "validation_run_status": False,
                 "status": True,
-                "original_links": str(original_links),
-                "tags": tags,
-                "citations": str(source_links)  
-            },
+                "original_links": str(entry["original_links"]),
+                "tags": entry["tags"],
+                "citations": str(entry["source_links"]),
+            }
         )
-        logging.info("Added answer in ip_answer table ")
 
-        return {"_id": ip_answer_obj["_id"], "answer": answer, "ip_id": ip_id}
+    try:
+        response = es.bulk(operations=operations)
     except Exception as e:
-        logging.error(f"Failed to ADD Prompts RUN LOGS from Index, {e}")
+        logging.error(f"Failed to ADD answers in ip_answer, {e}")
+        return [None] * len(prompt_answers)
+
+    ip_answer_objs = []
+    for entry, ip_id, item in zip(prompt_answers, ip_ids, response["items"]):
+        result = item["index"]
+        if "error" in result:
+            logging.error(f"Failed to ADD answer in ip_answer, {result['error']}")
+            ip_answer_objs.append(None)
+        else:
+            ip_answer_objs.append({"_id": result["_id"], "answer": entry["answer"], "ip_id": ip_id})
+    logging.info(f"Added {len(prompt_answers)} answers in ip_answer table")
+    return ip_answer_objs
+
 
-    
 def run_query_pipeline(inst_id, index, model="mixtral22b"):
     """
     Initiates the process of running a query pipeline for multiple prompts, saving the results.
@@ -555,7 +1214,7 @@ def run_query_pipeline(inst_id, index, model="mixtral22b"):
     - inst_id (str): The identifier for the institution for which the pipeline is run.
     - model (str): The model to be used for answer generation. Values are 3.5t mixtral7b mixtral22b llama. number of chunks for llama is 7
     - index (str): The name of the Elasticsearch index to be used for document retrieval.
-    This function reads prompts from an Excel file, processes each using the query pipeline, and saves the results.
+    Prompts are answered concurrently by answer_prompt_jobs and their answers are saved together at the end.
     """
     document_store = ElasticsearchDocumentStore(
         hosts=es_host, index=index, basic_auth=(es_user, es_password)
@@ -564,26 +1223,19 @@ def run_query_pipeline(inst_id, index, model="mixtral22b"):
     es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
     update_prompts_institute(inst_id)
     prompts_obj_id_dict = fetch_overall_prompts_from_es(es, prompts_index)
-    results = {}
     logging.info(
         f"Running query pipeline for institution ID: '{inst_id}' using model: '{model}'"
     )
 
-    new_prompt_status = False
     prompts_to_run_list = get_prompts_to_run(es, inst_id, prompts_obj_id_dict)
 
-    ip_answer_objs = []
-
-    for prompt_id in prompts_to_run_list:
+    prompt_jobs = []
+    for prompt_id in prompts_to_run_list or []:
+        prompt = None
         try:
             prompt_obj = prompts_obj_id_dict[prompt_id]
             source = prompt_obj["_source"]
-            new_prompt_status = True
             prompt = source["prompt"]
-            data_type = source["output_format"]
-            tags = source["tags"]
-            category = source["category"]
-            num_chunks = source["num_chunks"]
             if "search_terms" in source:
                 search_terms = source["search_terms"]
             else:
@@ -592,59 +1244,26 @@ def run_query_pipeline(inst_id, index, model="mixtral22b"):
                 response_type = source["response_type"]
             else:
                 response_type = "text"
-            results[prompt] = query_pipeline_answer_builder(
-                prompt,
-                inst_id,
-                data_type,
-                document_store,
-                search_terms=search_terms,
-                num_chunks=int(num_chunks),
-                model=model,
-                response_type=response_type,
-            )
-            answer_obj = (
-                results[prompt].get("answer_builder", {}).get("answers", [])[0].data
-            )
-
-            answer_obj = json.loads(answer_obj)
-            answer = answer_obj['answer']
-            sources = answer_obj['sources']
-
-            documents = (
-                results[prompt]
-                .get("answer_builder", {})
-                .get("answers", [])[0]
-                .documents
-            )
-
-            results[prompt].update(
-                {"data_type": data_type, "tags": tags, "category": category}
-            )
-
-            original_links = []
-            source_links = []
-
-            for doc in documents:
-                if str(doc.id) in sources:
-                    source_links.append(doc.meta["file_url"])
-                original_links.append(doc.meta["file_url"])
-
-            ip_id = add_prompts_institute_entry(es, inst_id, prompt_id)
-            ip_answer_obj = add_answer_in_ip_answer(
-                es, ip_id, answer, data_type, original_links, tags, source_links
+            prompt_jobs.append(
+                {
+                    "prompt_id": prompt_id,
+                    "prompt": prompt,
+                    "data_type": source["output_format"],
+                    "tags": source["tags"],
+                    "search_terms": search_terms,
+                    "num_chunks": int(source["num_chunks"]),
+                    "response_type": response_type,
+                }
             )
-            ip_answer_objs.append(ip_answer_obj)
-
         except Exception as e:
             logging.error(f"Error while running the prompt: {prompt} - {e}")
-            results[prompt] = {
-                "data_type": data_type,
-                "tags": tags,
-                "category": category,
-            }
+
+    prompt_answers = answer_prompt_jobs(prompt_jobs, inst_id, document_store, model)
 
     logging.info(
         f"Completed processing. Starting to save results for institution ID: '{inst_id}'"
     )
 
-    return ip_answer_objs
+    return save_prompt_answers(
+        es, inst_id, [entry for entry in prompt_answers if entry]
+    )
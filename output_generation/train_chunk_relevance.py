@@ -0,0 +1,153 @@
+"""
+Trains the CPU chunk relevance classifier and reports its agreement with the LLM judge and its latency.
+
+    python -m output_generation.train_chunk_relevance 39261 36347 3310 --dataset relevance.json
+
+For every overview prompt and institute, both searches run as in the query pipeline and the LLM
+judge of AIChunkCompressing labels each retrieved chunk. The labelled feature rows are kept in
+--dataset, so later runs only train and evaluate. Prompts are split into a fixed evaluation set
+by prompt id; the classifier and the threshold that best agrees with the judge on the training
+prompts are saved to --output, which CHUNK_RELEVANCE_MODEL_PATH points LocalChunkRelevanceFilter at.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+from elasticsearch import Elasticsearch
+from haystack.components.embedders import OpenAITextEmbedder
+from haystack.utils import Secret
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import cohen_kappa_score, precision_score, recall_score
+
+from utils.embedding_profiles import get_embedder_params
+from .custom_component import AIChunkCompressing, get_chunk_relevance_features
+from .custom_retriever import ElasticsearchHybridRetriever
+from .ouput_pipelines import (
+    es_host,
+    es_password,
+    es_user,
+    fetch_overall_prompts_from_es,
+    get_retrieval_filters,
+    open_ai_key,
+    prompts_index,
+)
+
+
+def is_evaluation_prompt(prompt_id, eval_share):
+    bucket = int(hashlib.sha256(prompt_id.encode("utf-8")).hexdigest(), 16) % 100
+    return bucket < eval_share * 100
+
+
+def collect_dataset(institute_ids, index):
+    es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+    text_embedder = OpenAITextEmbedder(
+        Secret.from_token(f"{open_ai_key}"), **get_embedder_params(index)
+    )
+    retriever = ElasticsearchHybridRetriever(client=es, index=index, top_k=20)
+    judge = AIChunkCompressing(name="LLM judge", mode="PARALLEL")
+
+    rows = []
+    prompts = fetch_overall_prompts_from_es(es, prompts_index)
+    for inst_id in institute_ids:
+        filters = get_retrieval_filters(inst_id, index)
+        for prompt_id, prompt_obj in prompts.items():
+            source = prompt_obj["_source"]
+            query = source["prompt"]
+            search_terms = source.get("search_terms") or query
+            query_embedding = text_embedder.run(text=search_terms)["embedding"]
+            retrieved = retriever.run(
+                query=search_terms, query_embedding=query_embedding, filters=filters
+            )
+            results = {
+                "embedding": retrieved["embedding_documents"],
+                "bm25": retrieved["bm25_documents"],
+            }
+            for retriever_name, chunks in results.items():
+                if not chunks:
+                    continue
+                start_time = time.perf_counter()
+                kept_ids = {chunk.id for chunk in judge.filter_parallel(chunks, query)}
+                llm_seconds = time.perf_counter() - start_time
+                features = get_chunk_relevance_features(chunks, query, query_embedding)
+                rows.append(
+                    {
+                        "prompt_id": prompt_id,
+                        "institute_id": inst_id,
+                        "retriever": retriever_name,
+                        "features": features.tolist(),
+                        "labels": [chunk.id in kept_ids for chunk in chunks],
+                        "llm_seconds": llm_seconds,
+                    }
+                )
+        print(f"Collected institute {inst_id}: {len(rows)} result lists so far")
+    return rows
+
+
+def stack(rows):
+    features = np.array([row for result in rows for row in result["features"]], dtype=np.float32)
+    labels = np.array([label for result in rows for label in result["labels"]], dtype=bool)
+    return features, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("institute_ids", nargs="*", type=int)
+    parser.add_argument("--index", default="chunk_by_sentence")
+    parser.add_argument("--dataset", default="chunk_relevance_dataset.json")
+    parser.add_argument("--output", default="chunk_relevance_model.joblib")
+    parser.add_argument("--eval-share", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if os.path.exists(args.dataset):
+        with open(args.dataset) as dataset_file:
+            rows = json.load(dataset_file)
+    else:
+        rows = collect_dataset(args.institute_ids, args.index)
+        with open(args.dataset, "w") as dataset_file:
+            json.dump(rows, dataset_file)
+
+    train_rows = [row for row in rows if not is_evaluation_prompt(row["prompt_id"], args.eval_share)]
+    eval_rows = [row for row in rows if is_evaluation_prompt(row["prompt_id"], args.eval_share)]
+    train_features, train_labels = stack(train_rows)
+    eval_features, eval_labels = stack(eval_rows)
+
+    classifier = LogisticRegression(class_weight="balanced", max_iter=1000)
+    classifier.fit(train_features, train_labels)
+    train_probabilities = classifier.predict_proba(train_features)[:, 1]
+    threshold = max(
+        np.linspace(0.05, 0.95, 19),
+        key=lambda t: np.mean((train_probabilities >= t) == train_labels),
+    )
+    joblib.dump({"classifier": classifier, "threshold": float(threshold)}, args.output)
+
+    start_time = time.perf_counter()
+    for row in eval_rows:
+        classifier.predict_proba(np.array(row["features"], dtype=np.float32))
+    local_seconds = (time.perf_counter() - start_time) / max(len(eval_rows), 1)
+    predictions = classifier.predict_proba(eval_features)[:, 1] >= threshold
+    llm_seconds = np.mean([row["llm_seconds"] for row in eval_rows]) if eval_rows else 0
+
+    print(
+        f"{len(train_labels)} training chunks, {len(eval_labels)} evaluation chunks "
+        f"({eval_labels.mean():.0%} judged relevant), threshold {threshold:.2f}"
+    )
+    print(
+        f"agreement with LLM judge {np.mean(predictions == eval_labels):.3f}, "
+        f"kappa {cohen_kappa_score(eval_labels, predictions):.3f}, "
+        f"precision {precision_score(eval_labels, predictions, zero_division=0):.3f}, "
+        f"recall {recall_score(eval_labels, predictions, zero_division=0):.3f}"
+    )
+    print(
+        f"latency per result list: LLM judge {llm_seconds * 1000:.0f} ms, "
+        f"local {local_seconds * 1000:.2f} ms (features precomputed)"
+    )
+    print(f"Saved model to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,8 @@ from .utils import (
 from crawling.utils import update_scrape_data_status
 from embedding.utils import update_institute_embedding_status
 from utils.url_recommended import url_recommended
+from utils.query_embedding_cache import precompute_prompt_embeddings
+from utils.answer_cache import invalidate_prompt_answers
 
 # Initialization
 load_dotenv()
@@ -94,16 +96,37 @@ def prompt_crud_operations(item):
         response = get_all_prompts()
     elif operation == "UPDATE":
         response = update_prompt(id, prompt)
+        drop_cached_answers(id)
+        warm_prompt_embeddings(id)
     elif operation == "DELETE":
         response = delete_prompt(id)
+        drop_cached_answers(id)
     elif operation == "CREATE":
         response = add_prompt(prompt)
+        warm_prompt_embeddings(response["_id"])
     else:
         response = "Invalid operation"
 
     return response
 
 
+def warm_prompt_embeddings(prompt_id):
+    try:
+        # Updates may be partial, so embed what is stored
+        precompute_prompt_embeddings(es.get(index="prompts", id=prompt_id)["_source"])
+    except Exception as e:
+        # The prompt is saved; its embedding is computed on first use instead
+        logging.error(f"Failed to precompute embeddings for prompt: {e}")
+
+
+def drop_cached_answers(prompt_id):
+    try:
+        invalidate_prompt_answers(prompt_id)
+    except Exception as e:
+        # Edited prompts get a new version in the cache key, so stale answers are never reused
+        logging.error(f"Failed to drop cached answers of prompt: {e}")
+
+
 def populate_institutes_to_scrape(item):
     try:
         error_messages = {}
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from elasticsearch import BadRequestError, Elasticsearch, NotFoundError
+
+load_dotenv()
+es_host = os.getenv("ELASTIC_SEARCH_HOST")
+es_user = os.getenv("ELASTICSEARCH_USER")
+es_password = os.getenv("ELASTICSEARCH_PASSWORD")
+answer_cache_index = os.environ.get("ANSWER_CACHE_INDEX", "prompt_answer_cache")
+
+es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+
+answer_cache_mapping = {
+    "properties": {
+        "prompt_id": {"type": "keyword"},
+        "prompt_version": {"type": "keyword"},
+        "model": {"type": "keyword"},
+        "chunk_keys": {"type": "keyword"},
+        # Only ever read back by ID, so the answer is stored but not indexed
+        "answer": {"type": "text", "index": False},
+        "created_at": {"type": "date"},
+    }
+}
+
+_cache_index_ready = False
+
+
+def get_prompt_version(job):
+    """
+    Fingerprints the prompt fields the answer depends on, so an edited prompt never matches an older answer.
+    """
+    fields = [
+        job["prompt"],
+        job["data_type"],
+        job.get("search_terms"),
+        job.get("num_chunks"),
+        job.get("response_type"),
+    ]
+    return hashlib.sha256(json.dumps(fields, default=str).encode("utf-8")).hexdigest()
+
+
+def get_chunk_key(doc):
+    """
+    Identifies a chunk by its file, its page in the file and its content hash. Unlike the chunk's id, the key
+    doesn't change when the institute is re-embedded with the same content.
+    """
+    content_hash = hashlib.sha256((doc.content or "").encode("utf-8")).hexdigest()
+    return hashlib.sha256(
+        json.dumps([doc.meta.get("file_url"), doc.meta.get("page_number"), content_hash]).encode("utf-8")
+    ).hexdigest()
+
+
+def get_context_fingerprint(documents):
+    """
+    Fingerprints the chunks an answer is generated from by their sorted chunk keys.
+    """
+    return hashlib.sha256(json.dumps(sorted(get_chunk_key(doc) for doc in documents)).encode("utf-8")).hexdigest()
+
+
+def _map_sources(answer, source_map):
+    answer_obj = json.loads(answer)
+    answer_obj["sources"] = [source_map.get(str(source), str(source)) for source in answer_obj.get("sources", [])]
+    return json.dumps(answer_obj)
+
+
+def get_cache_key(prompt_id, prompt_version, model, context_fingerprint):
+    return hashlib.sha256(
+        json.dumps([prompt_id, prompt_version, model, context_fingerprint]).encode("utf-8")
+    ).hexdigest()
+
+
+def _ensure_cache_index():
+    global _cache_index_ready
+    if _cache_index_ready:
+        return
+    if not es.indices.exists(index=answer_cache_index):
+        try:
+            es.indices.create(index=answer_cache_index, mappings=answer_cache_mapping)
+        except BadRequestError as e:
+            # Another worker created it first
+            if e.error != "resource_already_exists_exception":
+                raise
+    _cache_index_ready = True
+
+
+def get_cached_answer(key, documents):
+    """
+    Returns the answer stored under the key, as the answer builder's answer data, or None.
+
+    Sources are cached as chunk keys and returned as the ids of the given chunks, which may differ from the ids
+    of the chunks the answer was generated from.
+    """
+    try:
+        answer = es.get(index=answer_cache_index, id=key, source=["answer"])["_source"]["answer"]
+        return _map_sources(answer, {get_chunk_key(doc): str(doc.id) for doc in documents})
+    except NotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Answer cache lookup failed: {e}")
+        return None
+
+
+def store_cached_answer(key, prompt_id, prompt_version, model, documents, answer):
+    try:
+        _ensure_cache_index()
+        es.index(
+            index=answer_cache_index,
+            id=key,
+            document={
+                "prompt_id": prompt_id,
+                "prompt_version": prompt_version,
+                "model": model,
+                "chunk_keys": sorted(get_chunk_key(doc) for doc in documents),
+                "answer": _map_sources(answer, {str(doc.id): get_chunk_key(doc) for doc in documents}),
+                "created_at": datetime.now(),
+            },
+        )
+    except Exception as e:
+        logging.error(f"Failed to store answer in cache: {e}")
+
+
+def invalidate_prompt_answers(prompt_id):
+    """
+    Drops every cached answer of the prompt, for all institutes and models.
+    """
+    try:
+        response = es.delete_by_query(
+            index=answer_cache_index,
+            query={"term": {"prompt_id": prompt_id}},
+            conflicts="proceed",
+        )
+        logging.info(f"Dropped {response['deleted']} cached answers of prompt {prompt_id}")
+    except NotFoundError:
+        # Nothing cached yet
+        pass
@@ -5,6 +5,7 @@ from fastapi import HTTPException, Request
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
+import threading
 from openai import AzureOpenAI
 
 # Modules
@@ -15,6 +16,9 @@ load_dotenv
 jwt_secret = os.getenv("SAARTHI_GPT_JWT_SECRET")
 azure_endpoint = os.getenv("AZURE_4OMINI_ENDPOINT")
 azure_key = os.getenv("AZURE_4OMINI_KEY")
+# LLM requests in flight across every institute and prompt of the process
+llm_max_concurrent_requests = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", 16))
+llm_request_slots = threading.BoundedSemaphore(llm_max_concurrent_requests)
 
 client = AzureOpenAI(
         api_key=azure_key,
@@ -63,15 +67,30 @@ async def check_authorization(request: Request):
         raise HTTPException(status_code=401, detail="Not Authorized!")
     
 def get_response_from_gpt(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that Understands a user query and give Answer in Yes or No.",
-            },
-            {"role": "user", "content": prompt},
-        ],
-    )
+    with llm_request_slots:
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are a helpful assistant that Understands a user query and give Answer in Yes or No.",
+                },
+                {"role": "user", "content": prompt},
+            ],
+        )
+
+    return response.choices[0].message.content
+
+
+def get_response_from_gpt_with_system(prompt, system_prompt):
+    with llm_request_slots:
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0,
+        )
 
-    return response.choices[0].message.content
\ No newline at end of file
+    return response.choices[0].message.content
@@ -4,12 +4,16 @@ from multiprocessing import Process
 from queue import Queue, Empty
 from typing import Dict, Set
 from embedding.controller import generate_embedding
+from embedding.pdf_to_markdown import init_pdf_converter_process
+from embedding.utils import suspended_refresh
 from utils.elastic import fetch_institute_for_embedding
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 log_files_folder = os.environ.get("LOG_FILES_FOLDER")
+# Suspend chunk index refresh while the queue drains, for mass onboarding
+auto_run_bulk_ingest = os.environ.get("AUTO_RUN_BULK_INGEST", "false").lower() == "true"
 
 
 try:
@@ -25,6 +29,20 @@ except Exception as e:
 
 
 def auto_run():
+    if auto_run_bulk_ingest:
+        with suspended_refresh("chunk_by_sentence"):
+            run_embedding_queue()
+    else:
+        run_embedding_queue()
+
+
+def generate_embedding_process(inst_id, chunk_index, index_type, converter_processes):
+    # Take this process's share of the host's PDF page workers before converting anything
+    init_pdf_converter_process(converter_processes)
+    generate_embedding(inst_id, chunk_index, index_type)
+
+
+def run_embedding_queue():
     in_queue: Queue = Queue()
     currently_running: Dict[str, Process] = {}
     processed_institutes: Set[str] = set()
@@ -55,8 +73,8 @@ def auto_run():
                 try:
                     inst_id = in_queue.get(block=False)
                     process = Process(
-                        target=generate_embedding,
-                        args=(inst_id, "chunk_by_sentence", "sentence"),
+                        target=generate_embedding_process,
+                        args=(inst_id, "chunk_by_sentence", "sentence", max_available_slots),
                     )
                     process.start()
                     currently_running[inst_id] = process
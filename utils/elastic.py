@@ -57,6 +57,43 @@ def fetch_institute_for_embedding():
     return institutes
 
 
+def get_active_chunk_generation(institute_id, chunk_index):
+    """
+    Returns the chunk generation retrieval should use for the institute, or None for institutes embedded
+    before generations, whose chunks are still selected by `status`.
+    """
+    response = es.search(
+        index="institute",
+        query={"term": {"cld_id": int(institute_id)}},
+        source=[f"chunk_generations.{chunk_index}"],
+        size=1,
+    )
+    hits = response["hits"]["hits"]
+    if not hits:
+        return None
+    return hits[0]["_source"].get("chunk_generations", {}).get(chunk_index)
+
+
+def activate_chunk_generation(institute_id, chunk_index, generation):
+    response = es.search(
+        index="institute", query={"term": {"cld_id": int(institute_id)}}, source=False
+    )
+    for hit in response["hits"]["hits"]:
+        es.update(
+            index="institute",
+            id=hit["_id"],
+            body={
+                "doc": {
+                    "chunk_generations": {chunk_index: generation},
+                    "updated_at": datetime.now(),
+                }
+            },
+        )
+    logging.info(
+        f"Activated generation {generation} of {chunk_index} for institute {institute_id}"
+    )
+
+
 def fetch_ip_answer():
     ip_answer_objs = []
     query = {
@@ -0,0 +1,83 @@
+import logging
+import os
+
+from elasticsearch import BadRequestError
+
+# dimensions=None keeps the model's native size and leaves dims to be inferred from the first chunk written
+EMBEDDING_PROFILES = {
+    "large-3072": {"model": "text-embedding-3-large", "dimensions": None, "quantized": False},
+    "large-1024": {"model": "text-embedding-3-large", "dimensions": 1024, "quantized": False},
+    "large-1024-int8": {"model": "text-embedding-3-large", "dimensions": 1024, "quantized": True},
+    "large-256": {"model": "text-embedding-3-large", "dimensions": 256, "quantized": False},
+    "large-256-int8": {"model": "text-embedding-3-large", "dimensions": 256, "quantized": True},
+}
+DEFAULT_EMBEDDING_PROFILE = "large-3072"
+
+# Profiles follow the chunk index, so documents and queries are always embedded alike,
+# e.g. "chunk_by_sentence_256=large-256-int8,chunk_by_passage=large-1024"
+chunk_index_profiles = {}
+for entry in os.environ.get("CHUNK_INDEX_EMBEDDING_PROFILES", "").split(","):
+    if "=" in entry:
+        index_name, profile_name = (part.strip() for part in entry.split("=", 1))
+        if profile_name in EMBEDDING_PROFILES:
+            chunk_index_profiles[index_name] = profile_name
+        else:
+            logging.error(f"Unknown embedding profile {profile_name} for {index_name}")
+
+
+def get_embedding_profile(chunk_index):
+    return EMBEDDING_PROFILES[
+        chunk_index_profiles.get(chunk_index, DEFAULT_EMBEDDING_PROFILE)
+    ]
+
+
+def get_embedder_params(chunk_index):
+    # Keyword arguments for OpenAIDocumentEmbedder and OpenAITextEmbedder
+    profile = get_embedding_profile(chunk_index)
+    return {"model": profile["model"], "dimensions": profile["dimensions"]}
+
+
+def get_chunk_index_mapping(chunk_index):
+    """
+    Returns the mapping ElasticsearchDocumentStore creates for a new index, with the vector field sized and
+    quantized according to the index's embedding profile.
+    """
+    profile = get_embedding_profile(chunk_index)
+    embedding_mapping = {"type": "dense_vector", "index": True, "similarity": "cosine"}
+    if profile["dimensions"]:
+        embedding_mapping["dims"] = profile["dimensions"]
+    if profile["quantized"]:
+        embedding_mapping["index_options"] = {"type": "int8_hnsw"}
+
+    return {
+        "properties": {
+            "embedding": embedding_mapping,
+            "content": {"type": "text"},
+        },
+        "dynamic_templates": [
+            {
+                "strings": {
+                    "path_match": "*",
+                    "match_mapping_type": "string",
+                    "mapping": {"type": "keyword"},
+                }
+            }
+        ],
+    }
+
+
+def create_chunk_index(es, chunk_index):
+    # Must run before the document store's client first touches the index, or it creates the default mapping
+    if es.indices.exists(index=chunk_index):
+        return
+    try:
+        es.indices.create(index=chunk_index, mappings=get_chunk_index_mapping(chunk_index))
+    except BadRequestError as e:
+        # Another worker created it first
+        if e.error != "resource_already_exists_exception":
+            raise
+        return
+    logging.info(
+        f"Created {chunk_index} with embedding profile "
+        f"{chunk_index_profiles.get(chunk_index, DEFAULT_EMBEDDING_PROFILE)}"
+    )
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from dotenv import load_dotenv
+from elasticsearch import BadRequestError, Elasticsearch, NotFoundError
+from haystack.components.embedders import OpenAITextEmbedder
+from haystack.utils import Secret
+
+from .embedding_profiles import (
+    DEFAULT_EMBEDDING_PROFILE,
+    EMBEDDING_PROFILES,
+    chunk_index_profiles,
+)
+
+load_dotenv()
+es_host = os.getenv("ELASTIC_SEARCH_HOST")
+es_user = os.getenv("ELASTICSEARCH_USER")
+es_password = os.getenv("ELASTICSEARCH_PASSWORD")
+open_ai_key = os.environ.get("OPENAI_API_KEY")
+query_embedding_cache_index = os.environ.get(
+    "QUERY_EMBEDDING_CACHE_INDEX", "query_embedding_cache"
+)
+query_embedding_cache_size = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+
+es = Elasticsearch(es_host, basic_auth=(es_user, es_password))
+
+query_embedding_cache_mapping = {
+    "properties": {
+        "model": {"type": "keyword"},
+        "dimensions": {"type": "integer"},
+        "text": {"type": "text"},
+        # Only ever read back by ID, so the vector is stored but not indexed
+        "embedding": {"type": "object", "enabled": False},
+        "created_at": {"type": "date"},
+    }
+}
+
+_memory_cache = OrderedDict()
+_memory_cache_lock = threading.Lock()
+_cache_index_ready = False
+
+
+def get_cache_key(model, dimensions, text):
+    return hashlib.sha256(json.dumps([model, dimensions, text]).encode("utf-8")).hexdigest()
+
+
+def _remember(key, embedding):
+    with _memory_cache_lock:
+        _memory_cache[key] = embedding
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > query_embedding_cache_size:
+            _memory_cache.popitem(last=False)
+
+
+def _ensure_cache_index():
+    global _cache_index_ready
+    if _cache_index_ready:
+        return
+    if not es.indices.exists(index=query_embedding_cache_index):
+        try:
+            es.indices.create(
+                index=query_embedding_cache_index, mappings=query_embedding_cache_mapping
+            )
+        except BadRequestError as e:
+            # Another worker created it first
+            if e.error != "resource_already_exists_exception":
+                raise
+    _cache_index_ready = True
+
+
+def get_query_embedding(embedder: OpenAITextEmbedder, text):
+    """
+    Returns the embedding of the text, checking the in-process LRU and then the Elasticsearch tier before calling
+    the embedder. Entries are keyed by model, dimensions and text, so every embedding profile has its own.
+    """
+    key = get_cache_key(embedder.model, embedder.dimensions, text)
+    with _memory_cache_lock:
+        embedding = _memory_cache.get(key)
+        if embedding is not None:
+            _memory_cache.move_to_end(key)
+            return embedding
+
+    try:
+        embedding = es.get(
+            index=query_embedding_cache_index, id=key, source=["embedding"]
+        )["_source"]["embedding"]
+        _remember(key, embedding)
+        return embedding
+    except NotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Query embedding cache lookup failed: {e}")
+
+    embedding = embedder.run(text=text)["embedding"]
+    _remember(key, embedding)
+    try:
+        _ensure_cache_index()
+        es.index(
+            index=query_embedding_cache_index,
+            id=key,
+            document={
+                "model": embedder.model,
+                "dimensions": embedder.dimensions,
+                "text": text,
+                "embedding": embedding,
+                "created_at": datetime.now(),
+            },
+        )
+    except Exception as e:
+        logging.error(f"Failed to store query embedding: {e}")
+    return embedding
+
+
+def precompute_prompt_embeddings(prompt_obj):
+    """
+    Embeds the prompt's search text for every embedding profile in use, so prompt runs find it in the cache.
+    """
+    text = prompt_obj.get("search_terms") or prompt_obj.get("prompt")
+    if not text:
+        return
+    profile_names = {DEFAULT_EMBEDDING_PROFILE, *chunk_index_profiles.values()}
+    for params in {
+        (EMBEDDING_PROFILES[name]["model"], EMBEDDING_PROFILES[name]["dimensions"])
+        for name in profile_names
+    }:
+        embedder = OpenAITextEmbedder(
+            Secret.from_token(f"{open_ai_key}"), model=params[0], dimensions=params[1]
+        )
+        get_query_embedding(embedder, text)
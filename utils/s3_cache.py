@@ -0,0 +1,156 @@
+# Library
+import os
+import hashlib
+import logging
+import tempfile
+import time
+import threading
+from typing import Iterator
+from dotenv import load_dotenv
+
+# Modules
+from .s3_utils import S3_BUCKET, S3_STREAM_CHUNK_SIZE, get_s3_client, stream_s3_object
+
+# Initialization
+load_dotenv()
+
+s3_cache_folder = os.environ.get(
+    "S3_CACHE_FOLDER", os.path.join(tempfile.gettempdir(), "cld_s3_cache")
+)
+s3_cache_max_bytes = int(os.environ.get("S3_CACHE_MAX_BYTES", 20 * 1024**3))
+# Entries used this recently are never evicted, as a worker may be about to open the path get_path returned
+s3_cache_evict_grace_seconds = int(os.environ.get("S3_CACHE_EVICT_GRACE_SECONDS", 3600))
+
+
+class S3DocumentCache:
+    """
+    On-disk LRU cache of S3 objects keyed by (key, ETag).
+
+    A HEAD request resolves the current ETag, so a changed object is fetched
+    again while unchanged ones are served from disk. Entries are written
+    atomically, touched on every hit and the least recently used files are
+    evicted once the folder grows past `max_bytes`.
+
+    Workers share the folder, so one worker may evict a file another was
+    just given by `get_path`. Files already open stay readable after they
+    are unlinked, and entries used within `evict_grace_seconds` are never
+    evicted, which covers the gap between `get_path` and opening the file.
+    A reader that opens a path later than that can still get
+    FileNotFoundError. While all entries are recent, the folder may stay
+    over `max_bytes`.
+    """
+
+    def __init__(self, folder: str, max_bytes: int, evict_grace_seconds: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.evict_grace_seconds = evict_grace_seconds
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _entry_path(self, key: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{key}\0{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, digest[:2], digest)
+
+    @staticmethod
+    def _etag(key: str) -> str:
+        response = get_s3_client().head_object(Bucket=S3_BUCKET, Key=key)
+        return response["ETag"].strip('"')
+
+    def _lookup(self, key: str):
+        path = self._entry_path(key, self._etag(key))
+        try:
+            os.utime(path)
+            return path, True
+        except FileNotFoundError:
+            return path, False
+
+    def _chunks_to_entry(self, path: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        written = 0
+        try:
+            with open(tmp_path, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._account(written)
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        # Other workers share the folder, so re-scan rather than trusting the local counter
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        cutoff = time.time() - self.evict_grace_seconds
+        for mtime, size, path in sorted(entries):
+            if total <= target or mtime > cutoff:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        self._size = total
+        logging.info(f"S3 cache evicted down to {total} bytes in {self.folder}")
+
+    def get_path(self, key: str) -> str:
+        """
+        Returns the local path of the object, downloading it first on a miss.
+        """
+        path, hit = self._lookup(key)
+        if not hit:
+            for _ in self._chunks_to_entry(path, stream_s3_object(key)):
+                pass
+        return path
+
+    def read(self, key: str) -> bytes:
+        with open(self.get_path(key), "rb") as file:
+            return file.read()
+
+    def stream(self, key: str, chunk_size: int = S3_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Yields the object in chunks, from disk on a hit or straight from S3
+        (while filling the cache) on a miss.
+        """
+        path, hit = self._lookup(key)
+        if not hit:
+            yield from self._chunks_to_entry(path, stream_s3_object(key, chunk_size))
+            return
+
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+
+s3_document_cache = S3DocumentCache(
+    s3_cache_folder, s3_cache_max_bytes, s3_cache_evict_grace_seconds
+)
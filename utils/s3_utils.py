@@ -2,6 +2,8 @@
 import boto3
 import os
 import io
+import threading
+from typing import Iterator, Optional
 from botocore.client import Config
 from dotenv import load_dotenv
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
@@ -12,18 +14,89 @@ load_dotenv()
 aws_access_key = os.environ.get("AWS_ACCESS_KEY")
 aws_secret_key = os.environ.get("AWS_SECRET_KEY")
 aws_region = os.environ.get("AWS_REGION")
+s3_max_pool_connections = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 50))
+
+S3_BUCKET = "cld-data-extraction"
+S3_BUCKET_URL = f"https://{S3_BUCKET}.s3.amazonaws.com/"
+S3_STREAM_CHUNK_SIZE = 1024 * 1024
+
+_s3_client = None
+_s3_client_pid = None
+_s3_client_lock = threading.Lock()
 
 
 # Helper Functions
+def get_s3_client():
+    """
+    Returns the S3 client shared by every thread of the current process.
+
+    boto3 clients are thread-safe but not fork-safe, so a new client is built
+    the first time it is requested inside a (pool) worker process.
+    """
+    global _s3_client, _s3_client_pid
+
+    pid = os.getpid()
+    if _s3_client is None or _s3_client_pid != pid:
+        with _s3_client_lock:
+            if _s3_client is None or _s3_client_pid != pid:
+                _s3_client = boto3.client(
+                    "s3",
+                    aws_access_key_id=aws_access_key,
+                    aws_secret_access_key=aws_secret_key,
+                    config=Config(
+                        signature_version="s3v4",
+                        max_pool_connections=s3_max_pool_connections,
+                        tcp_keepalive=True,
+                        retries={"max_attempts": 5, "mode": "adaptive"},
+                    ),
+                    region_name=aws_region,
+                )
+                _s3_client_pid = pid
+    return _s3_client
+
+
+def get_s3_key(file_url):
+    if file_url.startswith(S3_BUCKET_URL):
+        return file_url[len(S3_BUCKET_URL) :]
+    return file_url
+
+
+def read_s3_object(key, start=None, end=None) -> bytes:
+    """
+    Reads an object, or the inclusive byte range [start, end] of it, into memory.
+    """
+    params = {"Bucket": S3_BUCKET, "Key": key}
+    if start is not None or end is not None:
+        params["Range"] = f"bytes={start or 0}-{'' if end is None else end}"
+
+    body = get_s3_client().get_object(**params)["Body"]
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+def stream_s3_object(
+    key, chunk_size=S3_STREAM_CHUNK_SIZE, start: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Yields an object in chunks as they arrive so callers can start parsing
+    before the whole body has been downloaded.
+    """
+    params = {"Bucket": S3_BUCKET, "Key": key}
+    if start:
+        params["Range"] = f"bytes={start}-"
+
+    body = get_s3_client().get_object(**params)["Body"]
+    try:
+        yield from body.iter_chunks(chunk_size=chunk_size)
+    finally:
+        body.close()
+
+
 def save_pdf_to_s3(doc_url, inst_id, content):
 
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=aws_access_key,
-        aws_secret_access_key=aws_secret_key,
-        config=Config(signature_version="s3v4"),
-        region_name=aws_region,
-    )
+    s3_client = get_s3_client()
 
     doc_name = f"{doc_url.split('/')[-1].lower()}"
     bucket = "cld-data-extraction"
@@ -41,13 +114,7 @@ def save_pdf_to_s3(doc_url, inst_id, content):
 
 def upload_html_to_s3(inst_id, content, file):
 
-    s3_client = boto3.client(
-        "s3",
-        aws_access_key_id=aws_access_key,
-        aws_secret_access_key=aws_secret_key,
-        config=Config(signature_version="s3v4"),
-        region_name=aws_region,
-    )
+    s3_client = get_s3_client()
 
     bucket = "cld-data-extraction"
     s3_path = "central_repo_data"
@@ -64,13 +131,7 @@ def upload_html_to_s3(inst_id, content, file):
 
 def check_folder_exists(bucket_name, folder_path):
     try:
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            config=Config(signature_version="s3v4"),
-            region_name=aws_region,
-        )
+        s3 = get_s3_client()
 
         result = s3.list_objects_v2(Bucket=bucket_name, Prefix=folder_path)
         return "Contents" in result